@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+WRITER_THREADS = 4
+# Writes allowed in flight before callers wait for a slot (the bounded queue)
+WRITER_MAX_PENDING = 64
+
+def write_atomic(path, data, fsync=False):
+    # Write to a sibling temp file and rename over the target, so readers never see a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(data)
+
+class AsyncWriter:
+    def __init__(self, threads=WRITER_THREADS, max_pending=WRITER_MAX_PENDING, fsync=False):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='writer')
+        self.max_pending = max_pending
+        self.slots = asyncio.Semaphore(max_pending)
+        self.fsync = fsync
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_depth = 0
+        self.stall_seconds = 0.0
+        self.files_written = 0
+        self.bytes_written = 0
+
+    @property
+    def queue_depth(self):
+        # Operations running or queued on the pool plus callers blocked waiting for a slot
+        return self.in_flight + self.waiting
+
+    async def run(self, func, *args):
+        self.waiting += 1
+        self.peak_depth = max(self.peak_depth, self.queue_depth)
+        started = time.monotonic()
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        stalled = time.monotonic() - started
+        if stalled > 0.05:
+            self.stall_seconds += stalled
+            logger.debug(f"Writer queue full, waited {stalled:.2f}s (depth {self.queue_depth})")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    async def write_bytes(self, path, data):
+        size = await self.run(write_atomic, path, data, self.fsync)
+        self.files_written += 1
+        self.bytes_written += size
+        return size
+
+    async def write_text(self, path, text, encoding='utf-8'):
+        return await self.write_bytes(path, text.encode(encoding))
+
+    async def makedirs(self, path):
+        await self.run(lambda: os.makedirs(path, exist_ok=True))
+
+    async def close(self):
+        # Every write is awaited by its caller, so once the slots are all free the pool is idle
+        for _ in range(self.max_pending):
+            await self.slots.acquire()
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        return (f"Writer: {self.files_written} files, {self.bytes_written / 1_000_000:.1f} MB, "
+                f"peak queue depth {self.peak_depth}/{self.max_pending}, stalled {self.stall_seconds:.1f}s on a full queue")
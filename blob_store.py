@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from async_writer import write_atomic
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    # Content-addressed image store: each unique body is kept once as <root>/ab/cd/<sha256>.<ext>
+    # and post folders get hardlinks to it (copies when the folder is on another filesystem).
+    # Methods do blocking IO, so crawls call them through AsyncWriter.run.
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.stored_bytes = 0
+        self.content_hits = 0
+        self.url_hits = 0
+        self.saved_bytes = 0
+        self.copies = 0
+
+    def blob_path(self, sha256, extension):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+    def put(self, data, extension):
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256, extension)
+        if os.path.exists(path):
+            with self.lock:
+                self.content_hits += 1
+                self.saved_bytes += len(data)
+            return sha256, path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+        with self.lock:
+            self.stored += 1
+            self.stored_bytes += len(data)
+        return sha256, path
+
+    def link(self, blob_path, dest):
+        tmp_path = dest + '.link.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copyfile(blob_path, tmp_path)
+            with self.lock:
+                self.copies += 1
+        os.replace(tmp_path, dest)
+
+    def put_and_link(self, data, dest):
+        # Stores the body under the extension of dest and links it there; returns the sha256
+        sha256, path = self.put(data, os.path.splitext(dest)[1].lstrip('.') or 'bin')
+        self.link(path, dest)
+        return sha256
+
+    def link_known(self, sha256, extension, dest):
+        # Links an already stored blob without fetching it again; False when the blob has gone missing
+        path = self.blob_path(sha256, extension)
+        if not os.path.exists(path):
+            return False
+        self.link(path, dest)
+        with self.lock:
+            self.url_hits += 1
+            self.saved_bytes += os.path.getsize(path)
+        return True
+
+    def summary(self):
+        return (f"Blob store: {self.stored} new blobs ({self.stored_bytes / 1_000_000:.1f} MB), "
+                f"{self.url_hits} fetches skipped, {self.content_hits} duplicate bodies, "
+                f"{self.saved_bytes / 1_000_000:.1f} MB not stored again"
+                f"{f', {self.copies} copied across filesystems' if self.copies else ''}")
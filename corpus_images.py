@@ -0,0 +1,37 @@
+import os
+from PIL import Image
+from xhs_cdn import CONTENT_TYPE_EXTENSIONS
+
+try:
+    # HEIC (and AVIF on older Pillow) decoders; without them those files are logged as unreadable by each stage
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+try:
+    import pillow_avif  # noqa: F401  registers itself on import
+except ImportError:
+    pass
+
+# Scraped image folders the post-processing stages (near_dup, palette, feature_store) walk by default
+DEFAULT_ROOTS = ['/Users/yz/Desktop/spider/xhs_search', '/Users/yz/Desktop/spider/xhs_profiles']
+
+# Every extension the scrapers can save, so no stage skips a file the crawl wrote
+IMAGE_EXTENSIONS = tuple(sorted({f".{extension}" for extension in CONTENT_TYPE_EXTENSIONS.values()} | {'.jpeg'}))
+
+def is_image_file(filename):
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+def iter_image_files(roots):
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if is_image_file(filename):
+                    yield os.path.join(dirpath, filename)
+
+def open_scaled(path, mode, edge):
+    # Opens an image asking the decoder for about edge x edge pixels; JPEG decoders can skip straight
+    # to a small scale, which is most of the decode cost for these stages. Use as a context manager.
+    image = Image.open(path)
+    image.draft(mode, (edge, edge))
+    return image
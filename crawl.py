@@ -0,0 +1,232 @@
+# Download, save and ledger pipeline shared by the XHS search and profile crawlers
+import asyncio
+import logging
+import os
+import aiohttp
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_fixed, RetryError
+from crawl_ledger import file_sha256
+from async_writer import write_atomic
+from video_downloader import download_video_file, VideoDownloadError
+from xhs_cdn import rewrite_image_url, extension_for, mirror_url, image_key
+from xhs_state import note_id_from_url
+
+logger = logging.getLogger(__name__)
+
+class Crawl:
+    # Per-crawl resources shared by every post worker
+    def __init__(self, session, capture=None, ledger=None, limiter=None, writer=None, image_variant=None, hedge=None, blobs=None, records=None):
+        self.session = session
+        self.capture = capture
+        self.ledger = ledger
+        self.limiter = limiter
+        self.writer = writer
+        # xhs_cdn.ImageVariant requested for post images
+        self.image_variant = image_variant
+        # hedging.HedgePolicy for image downloads, or None
+        self.hedge = hedge
+        # blob_store.BlobStore images are saved through, or None
+        self.blobs = blobs
+        # post_records.RecordWriter for structured output, or None
+        self.records = records
+        # Set once the CDN refuses image_variant; later images go straight to the page's URL
+        self.variant_refused = False
+
+class ImageRefused(aiohttp.ClientError):
+    # A 4xx (other than 429) for an image URL: asking again won't help, so it is not retried
+    pass
+
+EXTRACT_FIELDS_JS = """({fields, lists}) => {
+    const result = {fields: {}, lists: {}};
+    for (const [key, selector] of Object.entries(fields)) {
+        const element = document.querySelector(selector);
+        result.fields[key] = element ? element.textContent : null;
+    }
+    for (const [key, selector] of Object.entries(lists)) {
+        result.lists[key] = Array.from(document.querySelectorAll(selector), element => element.textContent);
+    }
+    return result;
+}"""
+
+async def extract_fields(page, selectors, list_selectors=None):
+    # One page.evaluate round trip for every field and list in the selector tables
+    data = await page.evaluate(EXTRACT_FIELDS_JS, {"fields": selectors, "lists": list_selectors or {}})
+    fields = {key: value if value is not None else "Not available" for key, value in data["fields"].items()}
+    return fields, data["lists"]
+
+async def fetch_image(session, url, limiter=None, pace=True):
+    # pace=False when the caller already took the limiter token
+    if limiter is not None and pace:
+        await limiter.acquire(url)
+    async with session.get(url, ssl=False) as response:
+        if limiter is not None:
+            limiter.record_status(url, response.status)
+        if response.status != 200:
+            logger.error(f"Failed to download image: {url} - Status code: {response.status}")
+            if 400 <= response.status < 500 and response.status != 429:
+                raise ImageRefused(f"Status code: {response.status}")
+            raise aiohttp.ClientError(f"Status code: {response.status}")
+        content = await response.read()
+        if len(content) == 0:
+            raise aiohttp.ClientPayloadError("Received empty response")
+        return content, response.headers.get('Content-Type')
+
+@retry(stop=stop_after_attempt(3), wait=wait_fixed(2), retry=retry_if_not_exception_type(ImageRefused))
+async def download_image(session, url, save_path, limiter=None, writer=None, hedge=None, store=None):
+    # A save_path without an extension gets one from the response's content type.
+    # With a hedge policy, slow requests are duplicated against a mirror CDN host.
+    # Returns the saved path and, when saved through a blob store, the body's sha256.
+    try:
+        if hedge is not None:
+            # Wait for our own token before the hedge clock starts, so only network time is measured
+            # and hedges answer CDN slowness rather than local pacing
+            if limiter is not None:
+                await limiter.acquire(url)
+            mirror = mirror_url(url)
+
+            async def fetch_mirror():
+                # A hedge spends a token from the primary host's bucket, so hedging stays within its pacing
+                if limiter is not None:
+                    await limiter.acquire(url)
+                return await fetch_image(session, mirror, limiter, pace=False)
+
+            content, content_type = await hedge.run(
+                lambda: fetch_image(session, url, limiter, pace=False),
+                fetch_mirror if mirror else None,
+            )
+        else:
+            content, content_type = await fetch_image(session, url, limiter)
+    except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError) as e:
+        logger.error(f"Error downloading image {url}: {e}")
+        raise
+    if not os.path.splitext(save_path)[1]:
+        save_path = f"{save_path}.{extension_for(content_type)}"
+    sha256 = None
+    if store is not None and writer is not None:
+        sha256 = await writer.run(store.put_and_link, content, save_path)
+    elif store is not None:
+        sha256 = store.put_and_link(content, save_path)
+    elif writer is not None:
+        await writer.write_bytes(save_path, content)
+    else:
+        write_atomic(save_path, content)
+    logger.info(f"Image downloaded: {save_path}")
+    return save_path, sha256
+
+async def link_known_blob(crawl, url, variant, save_stem):
+    # Path of a hardlink to the stored blob when this image was fetched by an earlier crawl, else None
+    if crawl.blobs is None or crawl.ledger is None:
+        return None
+    known = crawl.ledger.known_blob(image_key(url) or url, variant)
+    if known is None:
+        return None
+    sha256, extension = known
+    save_path = f"{save_stem}.{extension}"
+    if not await crawl.writer.run(crawl.blobs.link_known, sha256, extension, save_path):
+        return None
+    logger.info(f"Image linked from blob store: {save_path}")
+    return save_path, sha256
+
+async def save_image(crawl, url, save_stem):
+    # Returns the saved path, the CDN variant it holds and its sha256 when known
+    variant_name = 'as-is' if crawl.variant_refused else crawl.image_variant.name
+    known = await link_known_blob(crawl, url, variant_name, save_stem)
+    if known is not None:
+        return known[0], variant_name, known[1]
+
+    captured = None
+    if crawl.capture is not None and crawl.image_variant.as_is:
+        captured = crawl.capture.pop(url)
+    elif crawl.capture is not None:
+        crawl.capture.discard(url)
+    if captured is not None:
+        body, content_type = captured
+        save_path = f"{save_stem}.{extension_for(content_type)}"
+        sha256 = None
+        if crawl.blobs is not None:
+            sha256 = await crawl.writer.run(crawl.blobs.put_and_link, body, save_path)
+        else:
+            await crawl.writer.write_bytes(save_path, body)
+        logger.info(f"Image saved from browser response: {save_path}")
+        return save_path, 'as-is', sha256
+
+    variant_url, variant = rewrite_image_url(url, crawl.image_variant)
+    if variant_url != url and not crawl.variant_refused:
+        extension = crawl.image_variant.extension
+        try:
+            save_path, sha256 = await download_image(crawl.session, variant_url, f"{save_stem}.{extension}" if extension else save_stem,
+                                                     crawl.limiter, crawl.writer, crawl.hedge, crawl.blobs)
+            return save_path, variant, sha256
+        except ImageRefused as e:
+            crawl.variant_refused = True
+            logger.warning(f"CDN refused variant {variant} ({e}); using the page's URLs for the rest of the crawl")
+        except RetryError as e:
+            logger.warning(f"CDN variant {variant} unavailable for {url}, using the page's URL: {e}")
+    save_path, sha256 = await download_image(crawl.session, url, save_stem, crawl.limiter, crawl.writer, crawl.hedge, crawl.blobs)
+    return save_path, 'as-is', sha256
+
+async def download_video(session, url, save_path, limiter=None, writer=None):
+    # False when the download failed, so the post is recorded as failed and retried on the next run
+    try:
+        size = await download_video_file(session, url, save_path, limiter, writer=writer)
+        logger.info(f"Video downloaded: {save_path} ({size} bytes)")
+        return True
+    except (aiohttp.ClientError, asyncio.TimeoutError, VideoDownloadError) as e:
+        logger.error(f"Error downloading video {url}: {e}")
+        return False
+
+async def record_media(crawl, post_id, url, path, variant=None, sha256=None):
+    # Hash on the writer pool; the ledger's SQLite connection stays on the event loop thread
+    size = None
+    if os.path.exists(path):
+        if sha256 is None:
+            sha256 = await crawl.writer.run(file_sha256, path)
+        size = os.path.getsize(path)
+    crawl.ledger.record_media(post_id, url, path, sha256, size, variant)
+    if crawl.blobs is not None and sha256 is not None and variant is not None:
+        crawl.ledger.record_blob(image_key(url) or url, variant, sha256, os.path.splitext(path)[1].lstrip('.'))
+    return sha256
+
+async def post_worker(worker_id, context, queue, folder, crawl, results, scrape):
+    # scrape(page, post_url, folder, crawl) saves one post and returns whether it succeeded
+    page = await context.new_page()
+    try:
+        while True:
+            post_url = await queue.get()
+            try:
+                if post_url is None:
+                    return
+                success = await scrape(page, post_url, folder, crawl)
+                results[post_url] = success
+                if crawl.ledger is not None:
+                    crawl.ledger.record_post(folder, note_id_from_url(post_url), post_url, 'done' if success else 'failed')
+                if not success:
+                    logger.warning(f"[worker {worker_id}] Failed to scrape post {post_url}")
+            finally:
+                queue.task_done()
+    finally:
+        await page.close()
+
+async def scrape_posts(context, queue, folder, crawl, scrape, concurrency=1):
+    results = {}
+    workers = [asyncio.create_task(post_worker(i, context, queue, folder, crawl, results, scrape)) for i in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+    succeeded = sum(1 for success in results.values() if success)
+    logger.info(f"Scraped {succeeded}/{len(results)} posts with {concurrency} worker(s)")
+    return results
+
+async def discover_and_scrape_posts(discover, context, folder, crawl, scrape, concurrency=1):
+    # Workers consume post URLs while `discover` is still scrolling the feed
+    queue = asyncio.Queue()
+    scraping = asyncio.create_task(scrape_posts(context, queue, folder, crawl, scrape, concurrency))
+    try:
+        post_urls = await discover(queue)
+    finally:
+        for _ in range(concurrency):
+            queue.put_nowait(None)
+        results = await scraping
+    return post_urls, results
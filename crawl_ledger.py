@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = 'crawl_ledger.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    scope TEXT NOT NULL,
+    note_id TEXT NOT NULL,
+    post_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, note_id)
+);
+CREATE TABLE IF NOT EXISTS media (
+    note_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT,
+    size INTEGER,
+    variant TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (note_id, url)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    image_key TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (image_key, variant)
+);
+"""
+
+def default_ledger_path():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(script_dir, LEDGER_FILE)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CrawlLedger:
+    # Scope is the output folder a post was saved under (a keyword or user folder),
+    # so a post found again under a different keyword is still scraped there.
+    def __init__(self, path=None):
+        self.path = path or default_ledger_path()
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.conn.commit()
+
+    def migrate(self):
+        # Columns added after the first release; CREATE TABLE IF NOT EXISTS leaves old ledgers as they were
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(media)')}
+        if 'variant' not in columns:
+            self.conn.execute('ALTER TABLE media ADD COLUMN variant TEXT')
+
+    def close(self):
+        self.conn.close()
+
+    def status(self, scope, note_id):
+        row = self.conn.execute('SELECT status FROM posts WHERE scope = ? AND note_id = ?', (scope, note_id)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, scope, note_id):
+        return self.status(scope, note_id) == 'done'
+
+    def done_ids(self, scope):
+        rows = self.conn.execute("SELECT note_id FROM posts WHERE scope = ? AND status = 'done'", (scope,))
+        return {row[0] for row in rows}
+
+    def record_post(self, scope, note_id, post_url, status):
+        self.conn.execute(
+            """INSERT INTO posts (scope, note_id, post_url, status, attempts, updated_at)
+               VALUES (?, ?, ?, ?, 1, ?)
+               ON CONFLICT (scope, note_id) DO UPDATE SET
+                   post_url = excluded.post_url,
+                   status = excluded.status,
+                   attempts = posts.attempts + 1,
+                   updated_at = excluded.updated_at""",
+            (scope, note_id, post_url, status, time.time()),
+        )
+        self.conn.commit()
+
+    def record_media(self, note_id, url, path, sha256=None, size=None, variant=None):
+        if sha256 is None and os.path.exists(path):
+            sha256 = file_sha256(path)
+            size = os.path.getsize(path)
+        self.conn.execute(
+            """INSERT OR REPLACE INTO media (note_id, url, path, sha256, size, variant, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (note_id, url, path, sha256, size, variant, time.time()),
+        )
+        self.conn.commit()
+
+    def known_blob(self, image_key, variant):
+        # (sha256, extension) of the blob already stored for this image and variant, or None
+        return self.conn.execute('SELECT sha256, extension FROM blobs WHERE image_key = ? AND variant = ?',
+                                 (image_key, variant)).fetchone()
+
+    def record_blob(self, image_key, variant, sha256, extension):
+        self.conn.execute(
+            """INSERT OR REPLACE INTO blobs (image_key, variant, sha256, extension, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (image_key, variant, sha256, extension, time.time()),
+        )
+        self.conn.commit()
+
+    def media(self, note_id):
+        rows = self.conn.execute('SELECT url, path, sha256, size, variant FROM media WHERE note_id = ?', (note_id,))
+        return [dict(zip(('url', 'path', 'sha256', 'size', 'variant'), row)) for row in rows]
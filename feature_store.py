@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from corpus_images import DEFAULT_ROOTS, iter_image_files, open_scaled
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = 'feature_store'
+
+# Descriptor layout: 8x4x2 HSV colour histogram, 8 gradient orientations in each cell of a 2x2
+# grid (texture), and a mean-centred 8x4 grey thumbnail (layout). Blocks are Hellinger-normalised
+# and weighted, and the whole vector is unit length so a dot product is cosine similarity.
+COLOUR_BINS = (8, 4, 2)
+ORIENTATION_BINS = 8
+TEXTURE_GRID = 2
+LAYOUT_SIZE = (8, 4)
+BLOCK_WEIGHTS = {'colour': 1.0, 'texture': 1.0, 'layout': 0.5}
+DESCRIPTOR_DIM = (COLOUR_BINS[0] * COLOUR_BINS[1] * COLOUR_BINS[2]
+                  + ORIENTATION_BINS * TEXTURE_GRID * TEXTURE_GRID
+                  + LAYOUT_SIZE[0] * LAYOUT_SIZE[1])
+
+SAMPLE_EDGE = 128
+# Rows scored per matrix product during search; bounds the float32 working set to ~32 MB
+SEARCH_CHUNK_ROWS = 65536
+
+def default_store_dir():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(script_dir, STORE_DIR)
+
+def unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def colour_block(image):
+    hsv = np.asarray(image.convert('HSV'), dtype=np.int32).reshape(-1, 3)
+    h_bins, s_bins, v_bins = COLOUR_BINS
+    index = (hsv[:, 0] * h_bins // 256) * s_bins * v_bins + (hsv[:, 1] * s_bins // 256) * v_bins + hsv[:, 2] * v_bins // 256
+    return np.sqrt(np.bincount(index, minlength=h_bins * s_bins * v_bins) / len(hsv))
+
+def texture_block(grey):
+    # Magnitude-weighted histogram of gradient orientations (mod pi) per grid cell
+    gx = grey[1:-1, 2:] - grey[1:-1, :-2]
+    gy = grey[2:, 1:-1] - grey[:-2, 1:-1]
+    magnitude = np.hypot(gx, gy)
+    orientation = ((np.arctan2(gy, gx) % np.pi) / np.pi * ORIENTATION_BINS).astype(int) % ORIENTATION_BINS
+    rows = np.minimum(np.arange(gx.shape[0]) * TEXTURE_GRID // gx.shape[0], TEXTURE_GRID - 1)
+    cols = np.minimum(np.arange(gx.shape[1]) * TEXTURE_GRID // gx.shape[1], TEXTURE_GRID - 1)
+    cell = rows[:, None] * TEXTURE_GRID + cols[None, :]
+    index = (cell * ORIENTATION_BINS + orientation).ravel()
+    histogram = np.bincount(index, weights=magnitude.ravel(), minlength=ORIENTATION_BINS * TEXTURE_GRID * TEXTURE_GRID)
+    total = histogram.sum()
+    return np.sqrt(histogram / total) if total > 0 else histogram
+
+def layout_block(image):
+    thumb = np.asarray(image.convert('L').resize(LAYOUT_SIZE, Image.BILINEAR), dtype=np.float64).ravel()
+    return unit(thumb - thumb.mean())
+
+def describe_image(image):
+    image = image.convert('RGB')
+    image.thumbnail((SAMPLE_EDGE, SAMPLE_EDGE), Image.BILINEAR)
+    grey = np.asarray(image.convert('L'), dtype=np.float64)
+    blocks = [
+        BLOCK_WEIGHTS['colour'] * unit(colour_block(image)),
+        BLOCK_WEIGHTS['texture'] * unit(texture_block(grey)),
+        BLOCK_WEIGHTS['layout'] * layout_block(image),
+    ]
+    return unit(np.concatenate(blocks)).astype(np.float32)
+
+def describe_file(path):
+    # Runs in the process pool: (path, descriptor or None)
+    try:
+        with open_scaled(path, 'RGB', SAMPLE_EDGE * 2) as image:
+            return path, describe_image(image)
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.warning(f"Could not describe {path}: {e}")
+        return path, None
+
+class FeatureStore:
+    # Append-only float16 vectors in features.f16 (row i belongs to line i of features.ids).
+    # features.json holds the committed row count and ids length; anything past them is a torn
+    # append and is cut off by the next append, so a crash never leaves ids and rows misaligned.
+    def __init__(self, directory=None, dim=DESCRIPTOR_DIM):
+        self.directory = directory or default_store_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, 'features.f16')
+        self.ids_path = os.path.join(self.directory, 'features.ids')
+        self.meta_path = os.path.join(self.directory, 'features.json')
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            self.meta = {'dim': dim, 'count': 0, 'ids_bytes': 0}
+        if self.meta['dim'] != dim:
+            raise ValueError(f"Store has {self.meta['dim']}-d vectors, expected {dim}")
+        self.ids = self.load_ids()
+        self.positions = {path: row for row, path in enumerate(self.ids)}
+        self.matrix = None
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    def __len__(self):
+        return self.meta['count']
+
+    def load_ids(self):
+        if not self.meta['count']:
+            return []
+        with open(self.ids_path, 'rb') as f:
+            data = f.read(self.meta['ids_bytes'])
+        return data.decode('utf-8').split('\n')[:self.meta['count']]
+
+    def vectors(self):
+        # Read-only memory map of the committed rows; pages are only read as searches touch them
+        if self.matrix is None and len(self):
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(len(self), self.dim))
+        return self.matrix if self.matrix is not None else np.empty((0, self.dim), dtype=np.float16)
+
+    def append(self, paths, vectors):
+        if not paths:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16).reshape(len(paths), self.dim)
+        ids_data = ''.join(path + '\n' for path in paths).encode('utf-8')
+        for file_path, committed, data in ((self.vectors_path, len(self) * self.dim * 2, vectors.tobytes()),
+                                           (self.ids_path, self.meta['ids_bytes'], ids_data)):
+            with open(file_path, 'ab') as f:
+                f.truncate(committed)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta = {'dim': self.dim, 'count': len(self) + len(paths), 'ids_bytes': self.meta['ids_bytes'] + len(ids_data)}
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+        for path in paths:
+            self.positions[path] = len(self.ids)
+            self.ids.append(path)
+        self.matrix = None
+
+    def update(self, roots, workers=None, batch_size=2048):
+        # Describes images not yet in the store and appends them in batches
+        pending = [path for path in iter_image_files(roots) if path not in self.positions]
+        logger.info(f"{len(self)} images in store, {len(pending)} new")
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths, vectors = [], []
+            for path, vector in pool.map(describe_file, pending, chunksize=32):
+                if vector is None:
+                    continue
+                paths.append(path)
+                vectors.append(vector)
+                if len(paths) >= batch_size:
+                    self.append(paths, vectors)
+                    logger.info(f"Stored {len(self)} images")
+                    paths, vectors = [], []
+            self.append(paths, vectors)
+        logger.info(f"Appended {len(pending)} images in {time.monotonic() - started:.1f}s")
+        return len(pending)
+
+    def search(self, query, k=20, exclude=()):
+        # Brute-force cosine top-k over the memory map, one chunked matrix product at a time
+        query = np.asarray(query, dtype=np.float32)
+        excluded = {self.positions[path] for path in exclude if path in self.positions}
+        matrix = self.vectors()
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        want = k + len(excluded)
+        for start in range(0, len(matrix), SEARCH_CHUNK_ROWS):
+            scores = matrix[start:start + SEARCH_CHUNK_ROWS].astype(np.float32) @ query
+            if len(scores) > want:
+                top = np.argpartition(-scores, want - 1)[:want]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > want:
+                keep = np.argpartition(-best_scores, want - 1)[:want]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        results = [(float(best_scores[i]), self.ids[best_rows[i]]) for i in order if best_rows[i] not in excluded]
+        return results[:k]
+
+    def vector_for(self, path):
+        # Stored descriptor for an indexed path, otherwise computed from the file
+        row = self.positions.get(path)
+        if row is not None:
+            return self.vectors()[row].astype(np.float32)
+        _, vector = describe_file(path)
+        if vector is None:
+            raise ValueError(f"Could not read image {path}")
+        return vector
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Memory-mapped feature store for 'more like this' image search")
+    parser.add_argument('--store', default=None, help="store directory (default: feature_store/ next to this script)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help="describe and append images not yet in the store")
+    index_parser.add_argument('roots', nargs='*', default=DEFAULT_ROOTS)
+    index_parser.add_argument('--workers', type=int, default=None)
+    query_parser = commands.add_parser('query', help="images most similar to an image")
+    query_parser.add_argument('image')
+    query_parser.add_argument('-k', type=int, default=20)
+    args = parser.parse_args()
+
+    store = FeatureStore(args.store)
+    if args.command == 'index':
+        store.update(args.roots, args.workers)
+        return
+    image = os.path.abspath(args.image) if os.path.exists(args.image) else args.image
+    query = store.vector_for(image)
+    started = time.perf_counter()
+    results = store.search(query, args.k, exclude=[image])
+    print(f"Top {len(results)} of {len(store)} images in {1000 * (time.perf_counter() - started):.0f}ms")
+    for score, path in results:
+        print(f"{score:.3f}  {path}")
+
+if __name__ == '__main__':
+    main()
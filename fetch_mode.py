@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+FETCH_MODES_FILE = 'fetch_modes.json'
+
+# A site recorded as needing the browser is retried over plain HTTP after this long,
+# in case its search page has since become server-rendered
+RECHECK_AFTER_SECONDS = 7 * 24 * 3600
+
+# Interstitials that stand in for the real page until a browser has run their JavaScript
+# (Cloudflare, DataDome, PerimeterX). Bare "captcha" or "enable javascript" also appear in
+# ordinary server-rendered pages (reCAPTCHA footers, <noscript> banners), so they are not used.
+JS_GATE_PATTERNS = (
+    re.compile(r'<title>\s*(just a moment|attention required|please wait)', re.IGNORECASE),
+    re.compile(r'id=["\']?(cf-browser-verification|challenge-form|cf-challenge-running)', re.IGNORECASE),
+    re.compile(r'captcha-delivery\.com|px-captcha', re.IGNORECASE),
+)
+# A page with at least this many extracted images is usable whatever markers it carries
+GATED_MAX_IMAGES = 2
+
+def default_modes_path():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(script_dir, FETCH_MODES_FILE)
+
+def looks_js_gated(html, image_count=0):
+    # Called after extraction: a challenge page yields few or no images
+    if image_count > GATED_MAX_IMAGES:
+        return False
+    return any(pattern.search(html) for pattern in JS_GATE_PATTERNS)
+
+class FetchModes:
+    # Which path ('shopify', 'http' or 'browser') each site needed last time, persisted between runs
+    def __init__(self, path=None):
+        self.path = path or default_modes_path()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.modes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.modes = {}
+
+    def try_http_first(self, site):
+        entry = self.modes.get(site)
+        if entry is None or entry['mode'] != 'browser':
+            return True
+        return time.time() - entry['updated_at'] > RECHECK_AFTER_SECONDS
+
+    def record(self, site, mode, reason=''):
+        self.modes[site] = {'mode': mode, 'reason': reason, 'updated_at': time.time()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.modes, f, indent=2)
+        os.replace(tmp_path, self.path)
+        print(f"Fetch mode for {site}: {mode}{f' ({reason})' if reason else ''}")
+
+    def summary(self):
+        return ", ".join(f"{site}: {entry['mode']}" for site, entry in sorted(self.modes.items())) or "no sites recorded"
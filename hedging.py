@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Fire the hedge once a request has run longer than this percentile of recent latencies
+HEDGE_PERCENTILE = 0.95
+# Until enough latencies are seen, hedge after a fixed delay (seconds)
+HEDGE_INITIAL_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.25
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+class HedgePolicy:
+    # Hedged requests: start the primary, and if it is still running after the latency threshold
+    # start a duplicate against an alternate host; the first to succeed wins and the other is cancelled.
+    def __init__(self, percentile=HEDGE_PERCENTILE, initial_delay=HEDGE_INITIAL_DELAY,
+                 min_delay=HEDGE_MIN_DELAY, min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins_after_hedge = 0
+
+    def threshold(self):
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    async def run(self, primary, hedge=None):
+        # primary/hedge are zero-argument coroutine factories; hedge None means no alternate exists
+        self.requests += 1
+        started = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        hedge_task = None
+        try:
+            if hedge is not None:
+                done, _ = await asyncio.wait({primary_task}, timeout=self.threshold())
+                if not done:
+                    self.hedges += 1
+                    hedge_task = asyncio.ensure_future(hedge())
+            if hedge_task is None:
+                result = await primary_task
+                self.latencies.append(time.monotonic() - started)
+                return result
+
+            pending, error = {primary_task, hedge_task}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge_task:
+                        self.hedge_wins += 1
+                    else:
+                        self.primary_wins_after_hedge += 1
+                    self.latencies.append(time.monotonic() - started)
+                    return task.result()
+            raise error
+        finally:
+            for task in (primary_task, hedge_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    @property
+    def hedge_rate(self):
+        return self.hedges / self.requests if self.requests else 0.0
+
+    @property
+    def win_rate(self):
+        return self.hedge_wins / self.hedges if self.hedges else 0.0
+
+    def summary(self):
+        return (f"Hedging: {self.hedges}/{self.requests} requests hedged ({self.hedge_rate:.1%}), "
+                f"hedge won {self.hedge_wins} ({self.win_rate:.1%}), primary won {self.primary_wins_after_hedge}; "
+                f"current threshold {self.threshold():.2f}s at p{self.percentile * 100:.0f}")
@@ -0,0 +1,62 @@
+import logging
+from collections import OrderedDict
+from playwright.async_api import Error as PlaywrightError
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on image bytes held in memory before the oldest captures are dropped
+CAPTURE_BUDGET_BYTES = 256 * 1024 * 1024
+
+class ImageCapture:
+    def __init__(self, url_filter=None, budget_bytes=CAPTURE_BUDGET_BYTES):
+        self.url_filter = url_filter
+        self.budget_bytes = budget_bytes
+        self.bodies = OrderedDict()
+        self.held_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, target):
+        # Works on a page or a whole browser context
+        target.on('response', self.on_response)
+
+    def detach(self, target):
+        target.remove_listener('response', self.on_response)
+
+    async def on_response(self, response):
+        if response.request.resource_type != 'image' or response.status != 200:
+            return
+        url = response.url
+        if url in self.bodies or (self.url_filter and not self.url_filter(url)):
+            return
+        try:
+            body = await response.body()
+        except PlaywrightError as e:
+            logger.debug(f"Could not read image body {url}: {e}")
+            return
+        if not body:
+            return
+        content_type = response.headers.get('content-type', '').lower()
+        self.bodies[url] = (body, content_type)
+        self.held_bytes += len(body)
+        while self.held_bytes > self.budget_bytes and self.bodies:
+            _, (evicted, _) = self.bodies.popitem(last=False)
+            self.held_bytes -= len(evicted)
+
+    def pop(self, url):
+        captured = self.bodies.pop(url, None)
+        if captured is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.held_bytes -= len(captured[0])
+        return captured
+
+    def discard(self, url):
+        # Frees a capture that won't be used (e.g. a different CDN variant is wanted) without counting a hit
+        captured = self.bodies.pop(url, None)
+        if captured is not None:
+            self.held_bytes -= len(captured[0])
+
+    def summary(self):
+        return f"Reused {self.hits} browser-loaded images, {self.misses} fetched over HTTP"
@@ -0,0 +1,69 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Installs a MutationObserver on first call that queues <img> nodes as they are added or have
+# their src/srcset/data-src/data-srcset changed (lazy loaders), then drains the queue. Each call
+# therefore only serialises images that are new since the previous call, not the whole document.
+DRAIN_NEW_IMAGES_JS = """
+const state = window.__imageDiscovery || (window.__imageDiscovery = (() => {
+    const pending = new Set(document.images);
+    const queue = node => {
+        if (node.nodeType !== Node.ELEMENT_NODE) return;
+        if (node.tagName === 'IMG') pending.add(node);
+        else node.querySelectorAll('img').forEach(img => pending.add(img));
+    };
+    new MutationObserver(mutations => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'attributes') {
+                if (mutation.target.tagName === 'IMG') pending.add(mutation.target);
+            } else {
+                mutation.addedNodes.forEach(queue);
+            }
+        }
+    }).observe(document, {
+        childList: true,
+        subtree: true,
+        attributes: true,
+        attributeFilter: ['src', 'srcset', 'data-src', 'data-srcset'],
+    });
+    return {pending};
+})());
+const records = [];
+for (const img of state.pending) {
+    const picture = img.parentElement && img.parentElement.tagName === 'PICTURE' ? img.parentElement : null;
+    records.push({
+        src: img.getAttribute('src'),
+        dataSrc: img.getAttribute('data-src'),
+        srcset: img.getAttribute('srcset') || img.getAttribute('data-srcset'),
+        sizes: img.getAttribute('sizes'),
+        width: img.getAttribute('width'),
+        sourceSrcsets: picture ? [...picture.querySelectorAll('source')].map(s => s.getAttribute('srcset') || '') : [],
+    });
+}
+state.pending.clear();
+return records;
+"""
+
+class ImageDiscovery:
+    # Incremental <img> extraction for a Selenium driver. The observer lives in the page, so a
+    # navigation starts a fresh queue with every image on the new page; the seen-set still
+    # filters out URLs that were already returned.
+    def __init__(self, driver):
+        self.driver = driver
+        self.seen = set()
+
+    def new_images(self):
+        # Raw attribute records for <img> nodes added or changed since the previous call
+        records = self.driver.execute_script(DRAIN_NEW_IMAGES_JS) or []
+        logger.debug(f"{len(records)} new or changed <img> nodes")
+        return records
+
+    def unseen(self, urls):
+        # Keeps page order and drops URLs returned by any earlier pass
+        fresh = []
+        for url in urls:
+            if url not in self.seen:
+                self.seen.add(url)
+                fresh.append(url)
+        return fresh
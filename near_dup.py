@@ -0,0 +1,273 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from corpus_images import DEFAULT_ROOTS, iter_image_files, open_scaled
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'near_dup_index.db'
+
+# Hamming radius on the 64-bit pHash for a candidate, confirmed against the dHash radius.
+# Crops, filters and small watermarks usually stay within these.
+PHASH_RADIUS = 8
+DHASH_RADIUS = 12
+
+# Substring tables for multi-index hashing. Three 21-22 bit substrings keep buckets nearly empty
+# at a few hundred thousand images, and a radius-8 query probes ~250 keys per table (~0.2ms).
+# Radii of 9-11 still work but probe ~1.6k keys per table.
+MIH_CHUNKS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    phash INTEGER NOT NULL,
+    dhash INTEGER NOT NULL
+);
+"""
+
+def default_index_path():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(script_dir, INDEX_FILE)
+
+def bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).flatten()).tobytes(), 'big')
+
+def to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+DCT_32 = dct_matrix(32)
+
+def phash(image):
+    # 2-D DCT of a 32x32 grey thumbnail; bits are the 8x8 low frequencies against their median (DC excluded)
+    pixels = np.asarray(image.convert('L').resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (DCT_32 @ pixels @ DCT_32.T)[:8, :8].flatten()
+    return bits_to_int(low > np.median(low[1:]))
+
+def dhash(image):
+    # Horizontal gradient signs of a 9x8 grey thumbnail
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def hash_image(image):
+    return phash(image), dhash(image)
+
+def hash_file(path):
+    # Runs in the process pool: (path, phash, dhash), with None hashes for unreadable images
+    try:
+        with open_scaled(path, 'L', 64) as image:
+            return path, *hash_image(image)
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.warning(f"Could not hash {path}: {e}")
+        return path, None, None
+
+class MultiIndexHash:
+    # Multi-index hashing over 64-bit hashes: each hash is split into `chunks` substrings with a table
+    # per substring. By pigeonhole, a hash within Hamming radius r of the query matches the query on
+    # some substring to within r // chunks bits, so a query probes only those substring values and
+    # verifies the few candidates in full, instead of scanning the corpus.
+    def __init__(self, chunks=MIH_CHUNKS):
+        self.chunks = chunks
+        # Substring widths, e.g. 21/21/22 bits for three chunks
+        self.widths = [64 // chunks + (1 if chunk >= chunks - 64 % chunks else 0) for chunk in range(chunks)]
+        self.offsets = [sum(self.widths[:chunk]) for chunk in range(chunks)]
+        self.tables = [{} for _ in range(chunks)]
+        self.entries = []
+        self.flip_cache = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def substrings(self, value):
+        return [(value >> offset) & ((1 << width) - 1) for offset, width in zip(self.offsets, self.widths)]
+
+    def flips(self, width, radius):
+        # Every mask over `width` bits with at most `radius` bits set
+        if (width, radius) not in self.flip_cache:
+            masks = [0]
+            for count in range(1, radius + 1):
+                masks.extend(sum(1 << bit for bit in bits) for bits in combinations(range(width), count))
+            self.flip_cache[width, radius] = masks
+        return self.flip_cache[width, radius]
+
+    def add(self, value, item):
+        index = len(self.entries)
+        self.entries.append((value, item))
+        for table, key in zip(self.tables, self.substrings(value)):
+            table.setdefault(key, []).append(index)
+
+    def query(self, value, radius):
+        # [(distance, hash, item)] for every stored hash within radius, nearest first
+        checked = set()
+        matches = []
+        for table, key, width in zip(self.tables, self.substrings(value), self.widths):
+            for flip in self.flips(width, radius // self.chunks):
+                for index in table.get(key ^ flip, ()):
+                    if index in checked:
+                        continue
+                    checked.add(index)
+                    stored, item = self.entries[index]
+                    distance = hamming(value, stored)
+                    if distance <= radius:
+                        matches.append((distance, stored, item))
+        return sorted(matches, key=lambda match: match[0])
+
+class NearDupIndex:
+    # Persistent pHash/dHash index over the scraped corpus, queried through an in-memory multi-index hash table
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.table = None
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, roots, workers=None):
+        # Hashes new or changed files under roots and forgets files that are gone. Hardlinked copies
+        # (e.g. from the blob store) are hashed once per inode.
+        known = {row[0]: (row[1], row[2]) for row in self.conn.execute('SELECT path, mtime, size FROM hashes')}
+        seen = set()
+        by_inode = {}
+        for path in iter_image_files(roots):
+            seen.add(path)
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            by_inode.setdefault((stat.st_dev, stat.st_ino), []).append((path, stat))
+
+        started = time.monotonic()
+        hashed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            representatives = [paths[0][0] for paths in by_inode.values()]
+            for (path, phash_value, dhash_value), paths in zip(pool.map(hash_file, representatives, chunksize=32), by_inode.values()):
+                if phash_value is None:
+                    continue
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO hashes (path, mtime, size, phash, dhash) VALUES (?, ?, ?, ?, ?)',
+                    [(p, stat.st_mtime, stat.st_size, to_signed(phash_value), to_signed(dhash_value)) for p, stat in paths],
+                )
+                hashed += 1
+                if hashed % 1000 == 0:
+                    self.conn.commit()
+                    logger.info(f"Hashed {hashed}/{len(representatives)} images")
+
+        root_prefixes = tuple(os.path.join(root, '') for root in roots)
+        removed = [path for path in known if path.startswith(root_prefixes) and path not in seen]
+        self.conn.executemany('DELETE FROM hashes WHERE path = ?', [(path,) for path in removed])
+        self.conn.commit()
+        self.table = None
+        logger.info(f"Index updated in {time.monotonic() - started:.1f}s: {hashed} images hashed, "
+                    f"{len(seen) - sum(len(p) for p in by_inode.values())} unchanged, {len(removed)} removed")
+        return hashed, len(removed)
+
+    def load_table(self):
+        if self.table is None:
+            self.table = MultiIndexHash()
+            for path, phash_value, dhash_value in self.conn.execute('SELECT path, phash, dhash FROM hashes'):
+                self.table.add(to_unsigned(phash_value), (path, to_unsigned(dhash_value)))
+        return self.table
+
+    def query(self, phash_value, dhash_value, radius=PHASH_RADIUS, dhash_radius=DHASH_RADIUS):
+        # [(phash distance, path)] of indexed images that are near-duplicates of the given hashes
+        return [(distance, path) for distance, _, (path, other_dhash) in self.load_table().query(phash_value, radius)
+                if hamming(dhash_value, other_dhash) <= dhash_radius]
+
+    def query_image(self, image, radius=PHASH_RADIUS, dhash_radius=DHASH_RADIUS):
+        # Works on in-memory images too, so a downloader can check a body before saving it
+        return self.query(*hash_image(image), radius, dhash_radius)
+
+    def query_file(self, path, radius=PHASH_RADIUS, dhash_radius=DHASH_RADIUS):
+        # Decoded the same way hash_file does, so a file hashes to the same bits as its index entry
+        with open_scaled(path, 'L', 64) as image:
+            return self.query_image(image, radius, dhash_radius)
+
+    def add(self, path, phash_value, dhash_value):
+        stat = os.stat(path)
+        self.conn.execute('INSERT OR REPLACE INTO hashes (path, mtime, size, phash, dhash) VALUES (?, ?, ?, ?, ?)',
+                          (path, stat.st_mtime, stat.st_size, to_signed(phash_value), to_signed(dhash_value)))
+        self.conn.commit()
+        if self.table is not None:
+            self.table.add(phash_value, (path, dhash_value))
+
+    def clusters(self, radius=PHASH_RADIUS, dhash_radius=DHASH_RADIUS):
+        # Groups of two or more near-duplicate paths (union-find over pairwise matches)
+        rows = [(path, to_unsigned(p), to_unsigned(d)) for path, p, d in self.conn.execute('SELECT path, phash, dhash FROM hashes')]
+        parent = {path: path for path, _, _ in rows}
+
+        def find(path):
+            while parent[path] != path:
+                parent[path] = parent[parent[path]]
+                path = parent[path]
+            return path
+
+        for path, phash_value, dhash_value in rows:
+            for _, other in self.query(phash_value, dhash_value, radius, dhash_radius):
+                parent[find(other)] = find(path)
+
+        groups = {}
+        for path in parent:
+            groups.setdefault(find(path), []).append(path)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Perceptual-hash near-duplicate index for scraped images")
+    parser.add_argument('--index', default=None, help="index database (default: next to this script)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help="hash new and changed images")
+    index_parser.add_argument('roots', nargs='*', default=DEFAULT_ROOTS)
+    index_parser.add_argument('--workers', type=int, default=None)
+    query_parser = commands.add_parser('query', help="list near-duplicates of an image")
+    query_parser.add_argument('image')
+    query_parser.add_argument('--radius', type=int, default=PHASH_RADIUS)
+    clusters_parser = commands.add_parser('clusters', help="print groups of near-duplicates")
+    clusters_parser.add_argument('--radius', type=int, default=PHASH_RADIUS)
+    args = parser.parse_args()
+
+    index = NearDupIndex(args.index)
+    try:
+        if args.command == 'index':
+            index.update(args.roots, args.workers)
+        elif args.command == 'query':
+            started = time.perf_counter()
+            index.load_table()
+            table_ready = time.perf_counter()
+            matches = index.query_file(args.image, args.radius)
+            print(f"{len(matches)} near-duplicates (tables built in {table_ready - started:.2f}s, "
+                  f"query {1000 * (time.perf_counter() - table_ready):.2f}ms)")
+            for distance, path in matches:
+                print(f"{distance:2d}  {path}")
+        else:
+            for group in index.clusters(args.radius):
+                print(f"{len(group)} images:")
+                for path in group:
+                    print(f"  {path}")
+    finally:
+        index.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from async_writer import write_atomic
+from corpus_images import is_image_file, open_scaled
+
+logger = logging.getLogger(__name__)
+
+PALETTE_FILE = 'palette.json'
+
+# Images are reduced to at most this many pixels on the long edge before clustering
+SAMPLE_EDGE = 96
+PALETTE_SIZE = 6
+KMEANS_ITERATIONS = 12
+
+# Hue families for the histogram; pixels below these saturation/value levels count as neutrals
+HUE_NAMES = ['red', 'orange', 'yellow', 'chartreuse', 'green', 'spring', 'cyan', 'azure', 'blue', 'violet', 'magenta', 'rose']
+NEUTRAL_SATURATION = 0.15
+NEUTRAL_VALUE = 0.12
+
+def load_pixels(path, edge=SAMPLE_EDGE):
+    # (N, 3) float32 RGB samples of a downscaled copy of the image
+    with open_scaled(path, 'RGB', edge * 2) as image:
+        image = image.convert('RGB')
+        image.thumbnail((edge, edge), Image.BILINEAR)
+        return np.asarray(image, dtype=np.float32).reshape(-1, 3)
+
+def kmeans(pixels, k=PALETTE_SIZE, iterations=KMEANS_ITERATIONS, seed=0):
+    # Vectorised Lloyd's k-means with k-means++ seeding; returns (centres, pixel counts) largest first
+    rng = np.random.default_rng(seed)
+    k = min(k, len(np.unique(pixels, axis=0)))
+    centres = np.empty((k, 3), dtype=np.float32)
+    centres[0] = pixels[rng.integers(len(pixels))]
+    nearest = ((pixels - centres[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        centres[i] = pixels[rng.choice(len(pixels), p=nearest / nearest.sum())]
+        nearest = np.minimum(nearest, ((pixels - centres[i]) ** 2).sum(axis=1))
+
+    for _ in range(iterations):
+        # Squared distances via |p|^2 - 2 p.c + |c|^2, one (N, k) matrix product per iteration
+        distances = (pixels ** 2).sum(axis=1)[:, None] - 2 * pixels @ centres.T + (centres ** 2).sum(axis=1)[None, :]
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centres)
+        np.add.at(sums, labels, pixels)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centres)
+        if np.allclose(moved, centres, atol=0.5):
+            centres = moved
+            break
+        centres = moved
+
+    order = np.argsort(-counts)
+    return centres[order], counts[order]
+
+def rgb_to_hsv(pixels):
+    # Vectorised RGB (0-255) to HSV with hue in [0, 1)
+    rgb = pixels / 255.0
+    maximum = rgb.max(axis=1)
+    minimum = rgb.min(axis=1)
+    delta = maximum - minimum
+    saturation = np.where(maximum > 0, delta / np.maximum(maximum, 1e-6), 0)
+    safe = np.maximum(delta, 1e-6)
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    hue = np.select(
+        [maximum == r, maximum == g],
+        [((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4,
+    ) / 6.0
+    return np.where(delta > 0, hue, 0), saturation, maximum
+
+def hue_histogram(pixels):
+    # Share of pixels per hue family, plus neutrals (greys, blacks, whites)
+    hue, saturation, value = rgb_to_hsv(pixels)
+    neutral = (saturation < NEUTRAL_SATURATION) | (value < NEUTRAL_VALUE)
+    # Bins are centred on their hue, so red covers the wrap-around at 0
+    bins = np.floor((hue * len(HUE_NAMES) + 0.5) % len(HUE_NAMES)).astype(int)
+    counts = np.bincount(bins[~neutral], minlength=len(HUE_NAMES))
+    total = len(pixels)
+    histogram = {name: round(float(count) / total, 4) for name, count in zip(HUE_NAMES, counts)}
+    histogram['neutral'] = round(float(neutral.sum()) / total, 4)
+    return histogram
+
+def to_hex(rgb):
+    return '#' + ''.join(f"{int(round(channel)):02x}" for channel in rgb)
+
+def analyse_image(path, palette_size=PALETTE_SIZE):
+    # Runs in the process pool: (path, result or None)
+    try:
+        pixels = load_pixels(path)
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return path, None
+    centres, counts = kmeans(pixels, palette_size)
+    total = counts.sum()
+    palette = [{'hex': to_hex(centre), 'rgb': [int(round(c)) for c in centre], 'share': round(float(count) / total, 4)}
+               for centre, count in zip(centres, counts) if count]
+    return path, {'palette': palette, 'hue_histogram': hue_histogram(pixels)}
+
+def post_palette(results, palette_size=PALETTE_SIZE):
+    # Post-level palette: k-means over every image's palette colours, weighted by their shares
+    colours = [(entry['rgb'], entry['share']) for result in results for entry in result['palette']]
+    if not colours:
+        return [], {}
+    rgb = np.array([colour for colour, _ in colours], dtype=np.float32)
+    weights = np.array([share for _, share in colours])
+    # Repeat each colour in proportion to its share so the clustering is weighted
+    samples = np.repeat(rgb, np.maximum(1, np.round(weights * 100).astype(int)), axis=0)
+    centres, counts = kmeans(samples, palette_size)
+    palette = [{'hex': to_hex(centre), 'rgb': [int(round(c)) for c in centre], 'share': round(float(count) / counts.sum(), 4)}
+               for centre, count in zip(centres, counts) if count]
+    histogram = {name: round(sum(result['hue_histogram'][name] for result in results) / len(results), 4)
+                 for name in results[0]['hue_histogram']}
+    return palette, histogram
+
+def find_posts(root):
+    # {post folder: [image paths]} for every folder under root that holds saved images
+    posts = {}
+    for dirpath, _, filenames in os.walk(root):
+        images = sorted(f for f in filenames if is_image_file(f))
+        if images:
+            posts[dirpath] = [os.path.join(dirpath, f) for f in images]
+    return posts
+
+def is_current(folder, images):
+    palette_path = os.path.join(folder, PALETTE_FILE)
+    if not os.path.exists(palette_path):
+        return False
+    written = os.path.getmtime(palette_path)
+    return all(os.path.getmtime(path) <= written for path in images)
+
+def update_post_info(folder, palette):
+    # Adds (or replaces) a "palette:" list in post_info.txt so colours sit with the rest of the post's metadata
+    info_path = os.path.join(folder, 'post_info.txt')
+    if not os.path.exists(info_path):
+        return
+    with open(info_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    text = re.sub(r'^palette:\n(?:- .*\n)*', '', text, flags=re.MULTILINE)
+    if text and not text.endswith('\n'):
+        text += '\n'
+    text += 'palette:\n' + ''.join(f"- {entry['hex']} ({entry['share']:.0%})\n" for entry in palette)
+    # post_info.txt is the crawler's record of the post, so it is never left truncated
+    write_atomic(info_path, text.encode('utf-8'))
+
+def write_post(folder, results):
+    palette, histogram = post_palette(list(results.values()))
+    document = {
+        'palette': palette,
+        'hue_histogram': histogram,
+        'images': {os.path.basename(path): result for path, result in sorted(results.items())},
+    }
+    # palette.json goes last: is_current trusts it, so it must not exist before post_info.txt is updated
+    update_post_info(folder, palette)
+    write_atomic(os.path.join(folder, PALETTE_FILE), json.dumps(document, ensure_ascii=False, indent=2).encode('utf-8'))
+
+def extract_palettes(root, workers=None, palette_size=PALETTE_SIZE, force=False):
+    posts = find_posts(root)
+    pending = {folder: images for folder, images in posts.items() if force or not is_current(folder, images)}
+    paths = [path for images in pending.values() for path in images]
+    logger.info(f"{len(posts)} posts under {root}, {len(pending)} to process ({len(paths)} images)")
+
+    started = time.monotonic()
+    by_folder = {folder: {} for folder in pending}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, result in pool.map(analyse_image, paths, [palette_size] * len(paths), chunksize=16):
+            if result is not None:
+                by_folder[os.path.dirname(path)][path] = result
+    for folder, results in by_folder.items():
+        if results:
+            write_post(folder, results)
+    elapsed = time.monotonic() - started
+    logger.info(f"Palettes for {len(paths)} images in {elapsed:.1f}s ({len(paths) / max(elapsed, 1e-6):.0f} images/s)")
+    return len(paths)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Dominant palettes and hue histograms for scraped post folders")
+    parser.add_argument('folder', help="keyword or user folder, e.g. xhs_search/<keyword>")
+    parser.add_argument('--colors', type=int, default=PALETTE_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="recompute posts whose palette.json is up to date")
+    args = parser.parse_args()
+    extract_palettes(args.folder, args.workers, args.colors, args.force)
+
+if __name__ == '__main__':
+    main()
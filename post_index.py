@@ -0,0 +1,336 @@
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import time
+from post_records import parse_count, text_or_none
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'post_index.db'
+DEFAULT_ROOTS = ['/Users/yz/Desktop/spider/xhs_search', '/Users/yz/Desktop/spider/xhs_profiles']
+
+# Keys the scrapers write; any other "x: y" line is a continuation of the previous value
+# (descriptions can span several lines)
+POST_KEYS = {'Post URL', 'title', 'description', 'date', 'author', 'likes', 'collects', 'comments', 'tags', 'palette'}
+USER_KEYS = {'Profile URL', 'User Name', 'Account number', 'IP Location', 'User Description', 'Gender and Tag',
+             'Following', 'Fans', 'Likes and Collects', 'Total Posts'}
+# Keys written as a "key:" line followed by "- item" lines; every other key holds text
+LIST_KEYS = {'tags', 'palette'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    scope TEXT,
+    url TEXT,
+    note_id TEXT,
+    title TEXT,
+    description TEXT,
+    date TEXT,
+    author TEXT,
+    likes INTEGER,
+    collects INTEGER,
+    comments INTEGER,
+    tags TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_likes ON posts (likes);
+CREATE INDEX IF NOT EXISTS posts_scope ON posts (scope);
+CREATE TABLE IF NOT EXISTS post_tags (
+    post_id INTEGER NOT NULL,
+    tag TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS post_tags_tag ON post_tags (tag, post_id);
+CREATE INDEX IF NOT EXISTS post_tags_post ON post_tags (post_id);
+CREATE TABLE IF NOT EXISTS users (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    url TEXT,
+    user_name TEXT,
+    account TEXT,
+    ip_location TEXT,
+    description TEXT,
+    gender_and_tag TEXT,
+    following INTEGER,
+    fans INTEGER,
+    likes_and_collects INTEGER,
+    total_posts INTEGER
+);
+"""
+
+# The trigram tokenizer (SQLite 3.34+) matches substrings, which suits Chinese text with no word
+# breaks; it cannot match terms shorter than three characters, so those fall back to LIKE.
+# Older SQLite gets unicode61, where CJK runs are single tokens.
+FTS_TOKENIZER = 'trigram' if sqlite3.sqlite_version_info >= (3, 34, 0) else 'unicode61'
+MIN_MATCH_TERM = 3 if FTS_TOKENIZER == 'trigram' else 1
+
+def default_index_path():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(script_dir, INDEX_FILE)
+
+def parse_info_file(path, keys):
+    # {key: str or [str]} from a post_info.txt / user_info.txt as the scrapers write them
+    fields = {}
+    current = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            key, sep, value = line.partition(':')
+            if sep and key in keys:
+                current = key
+                fields[key] = [] if key in LIST_KEYS else value.strip()
+            elif current in LIST_KEYS:
+                if line.startswith('- '):
+                    fields[current].append(line[2:].strip())
+            elif current is not None and line.strip():
+                # A value can also start on the line after an empty "key: "
+                fields[current] = f"{fields[current]}\n{line}" if fields[current] else line
+    return fields
+
+def normalize_tag(tag):
+    # "#穿搭[话题]#" -> "穿搭"
+    return re.sub(r'\[[^\]]*\]', '', tag).strip().strip('#').strip()
+
+def note_id_from_url(url):
+    match = re.search(r'/(?:explore|discovery/item|user/profile/[^/]+)/([0-9a-f]{16,})', url or '')
+    return match.group(1) if match else None
+
+def post_row(path, root):
+    fields = parse_info_file(path, POST_KEYS)
+    folder = os.path.dirname(path)
+    # Scope is the keyword or user folder directly under the root, e.g. xhs_search/<keyword>
+    scope = os.path.relpath(folder, root).split(os.sep)[0]
+    tags = [normalize_tag(tag) for tag in fields.get('tags') or [] if normalize_tag(tag)]
+    url = text_or_none(fields.get('Post URL'))
+    return {
+        'path': folder,
+        'scope': scope,
+        'url': url,
+        'note_id': note_id_from_url(url),
+        'title': text_or_none(fields.get('title')),
+        'description': text_or_none(fields.get('description')),
+        'date': text_or_none(fields.get('date')),
+        'author': text_or_none(fields.get('author')),
+        'likes': parse_count(text_or_none(fields.get('likes'))),
+        'collects': parse_count(text_or_none(fields.get('collects'))),
+        'comments': parse_count(text_or_none(fields.get('comments'))),
+        'tags': tags,
+    }
+
+def user_row(path):
+    fields = parse_info_file(path, USER_KEYS)
+
+    def strip_label(value):
+        value = text_or_none(value)
+        return value.split('：', 1)[-1] if value else value
+
+    return {
+        'path': os.path.dirname(path),
+        'url': text_or_none(fields.get('Profile URL')),
+        'user_name': text_or_none(fields.get('User Name')),
+        'account': strip_label(fields.get('Account number')),
+        'ip_location': strip_label(fields.get('IP Location')),
+        'description': text_or_none(fields.get('User Description')),
+        'gender_and_tag': text_or_none(fields.get('Gender and Tag')),
+        'following': parse_count(text_or_none(fields.get('Following'))),
+        'fans': parse_count(text_or_none(fields.get('Fans'))),
+        'likes_and_collects': parse_count(text_or_none(fields.get('Likes and Collects'))),
+        'total_posts': parse_count(text_or_none(fields.get('Total Posts'))),
+    }
+
+def iter_info_files(roots):
+    # (root, path, kind) for every post_info.txt / user_info.txt under roots
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            if 'post_info.txt' in filenames:
+                yield root, os.path.join(dirpath, 'post_info.txt'), 'post'
+            if 'user_info.txt' in filenames:
+                yield root, os.path.join(dirpath, 'user_info.txt'), 'user'
+
+def fts_query(terms):
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+class PostIndex:
+    # SQLite index over the scraped post_info.txt / user_info.txt files, with FTS5 on title,
+    # description and tags. Files are re-parsed only when their mtime changes.
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+                          f"title, description, tags, tokenize='{FTS_TOKENIZER}')")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def delete_post(self, post_id):
+        self.conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (post_id,))
+        self.conn.execute('DELETE FROM post_tags WHERE post_id = ?', (post_id,))
+        self.conn.execute('DELETE FROM posts WHERE id = ?', (post_id,))
+
+    def put_post(self, row, mtime):
+        existing = self.conn.execute('SELECT id FROM posts WHERE path = ?', (row['path'],)).fetchone()
+        if existing is not None:
+            self.delete_post(existing['id'])
+        columns = ['path', 'scope', 'url', 'note_id', 'title', 'description', 'date', 'author', 'likes', 'collects', 'comments']
+        cursor = self.conn.execute(
+            f"INSERT INTO posts ({', '.join(columns)}, tags, mtime) VALUES ({', '.join('?' * (len(columns) + 2))})",
+            [row[column] for column in columns] + ['\n'.join(row['tags']), mtime],
+        )
+        post_id = cursor.lastrowid
+        self.conn.executemany('INSERT INTO post_tags (post_id, tag) VALUES (?, ?)', [(post_id, tag) for tag in set(row['tags'])])
+        self.conn.execute('INSERT INTO posts_fts (rowid, title, description, tags) VALUES (?, ?, ?, ?)',
+                          (post_id, row['title'] or '', row['description'] or '', ' '.join(row['tags'])))
+
+    def put_user(self, row, mtime):
+        columns = list(row)
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO users ({', '.join(columns)}, mtime) VALUES ({', '.join('?' * (len(columns) + 1))})",
+            [row[column] for column in columns] + [mtime],
+        )
+
+    def update(self, roots):
+        # Parses new or changed info files under roots and forgets folders that are gone
+        started = time.monotonic()
+        known_posts = {row['path']: (row['id'], row['mtime']) for row in self.conn.execute('SELECT id, path, mtime FROM posts')}
+        known_users = {row['path']: row['mtime'] for row in self.conn.execute('SELECT path, mtime FROM users')}
+        seen = set()
+        parsed = 0
+        for root, path, kind in iter_info_files(roots):
+            folder = os.path.dirname(path)
+            seen.add((kind, folder))
+            mtime = os.path.getmtime(path)
+            if kind == 'post':
+                if known_posts.get(folder, (None, None))[1] == mtime:
+                    continue
+                try:
+                    self.put_post(post_row(path, root), mtime)
+                except (OSError, UnicodeDecodeError, ValueError, sqlite3.Error) as e:
+                    logger.warning(f"Could not index {path}: {e}")
+                    continue
+            else:
+                if known_users.get(folder) == mtime:
+                    continue
+                try:
+                    self.put_user(user_row(path), mtime)
+                except (OSError, UnicodeDecodeError, ValueError, sqlite3.Error) as e:
+                    logger.warning(f"Could not index {path}: {e}")
+                    continue
+            parsed += 1
+            if parsed % 1000 == 0:
+                self.conn.commit()
+                logger.info(f"Indexed {parsed} files")
+
+        root_prefixes = tuple(os.path.join(root, '') for root in roots)
+        removed_posts = [post_id for folder, (post_id, _) in known_posts.items()
+                         if folder.startswith(root_prefixes) and ('post', folder) not in seen]
+        removed_users = [folder for folder in known_users if folder.startswith(root_prefixes) and ('user', folder) not in seen]
+        for post_id in removed_posts:
+            self.delete_post(post_id)
+        self.conn.executemany('DELETE FROM users WHERE path = ?', [(folder,) for folder in removed_users])
+        self.conn.commit()
+        logger.info(f"Index updated in {time.monotonic() - started:.1f}s: {parsed} files parsed, "
+                    f"{len(seen) - parsed} unchanged, {len(removed_posts) + len(removed_users)} removed")
+        return parsed, len(removed_posts) + len(removed_users)
+
+    def search(self, text=None, tags=(), min_likes=None, min_collects=None, scope=None, author=None, limit=50):
+        # Posts matching every filter; full-text hits are ranked by bm25, the rest by likes
+        clauses, params = [], []
+        terms = (text or '').split()
+        match_terms = [term for term in terms if len(term) >= MIN_MATCH_TERM]
+        for term in terms:
+            if len(term) < MIN_MATCH_TERM:
+                clauses.append("(p.title LIKE ? OR p.description LIKE ? OR p.tags LIKE ?)")
+                params.extend([f"%{term}%"] * 3)
+        for tag in tags:
+            clauses.append("p.id IN (SELECT post_id FROM post_tags WHERE tag = ?)")
+            params.append(normalize_tag(tag))
+        for column, value in (('likes', min_likes), ('collects', min_collects)):
+            if value is not None:
+                clauses.append(f"p.{column} >= ?")
+                params.append(value)
+        if scope is not None:
+            clauses.append("p.scope = ?")
+            params.append(scope)
+        if author is not None:
+            clauses.append("p.author = ?")
+            params.append(author)
+
+        if match_terms:
+            sql = "SELECT p.* FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid WHERE posts_fts MATCH ?"
+            params.insert(0, fts_query(match_terms))
+            order = "bm25(posts_fts)"
+        else:
+            sql = "SELECT p.* FROM posts p WHERE 1"
+            order = "p.likes IS NULL, p.likes DESC"
+        sql += ''.join(f" AND {clause}" for clause in clauses) + f" ORDER BY {order} LIMIT ?"
+        return [dict(row) for row in self.conn.execute(sql, params + [limit])]
+
+    def users(self, text=None, min_fans=None, limit=50):
+        clauses, params = [], []
+        if text:
+            clauses.append("(user_name LIKE ? OR description LIKE ? OR account = ?)")
+            params.extend([f"%{text}%", f"%{text}%", text])
+        if min_fans is not None:
+            clauses.append("fans >= ?")
+            params.append(min_fans)
+        sql = "SELECT * FROM users" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        sql += " ORDER BY fans IS NULL, fans DESC LIMIT ?"
+        return [dict(row) for row in self.conn.execute(sql, params + [limit])]
+
+    def top_tags(self, limit=30):
+        return [(row['tag'], row['posts']) for row in self.conn.execute(
+            'SELECT tag, COUNT(*) AS posts FROM post_tags GROUP BY tag ORDER BY posts DESC LIMIT ?', (limit,))]
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Searchable SQLite/FTS5 index over scraped post and user info")
+    parser.add_argument('--index', default=None, help="index database (default: next to this script)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help="parse new and changed post_info.txt / user_info.txt files")
+    index_parser.add_argument('roots', nargs='*', default=DEFAULT_ROOTS)
+    search_parser = commands.add_parser('search', help="find posts by text, tag and counts")
+    search_parser.add_argument('text', nargs='?', default=None, help="words to match in title, description and tags")
+    search_parser.add_argument('--tag', action='append', default=[], help="exact tag; repeat to require several")
+    search_parser.add_argument('--min-likes', type=int, default=None)
+    search_parser.add_argument('--min-collects', type=int, default=None)
+    search_parser.add_argument('--scope', default=None, help="keyword or user folder name")
+    search_parser.add_argument('--author', default=None)
+    search_parser.add_argument('--limit', type=int, default=50)
+    users_parser = commands.add_parser('users', help="find scraped profiles")
+    users_parser.add_argument('text', nargs='?', default=None)
+    users_parser.add_argument('--min-fans', type=int, default=None)
+    users_parser.add_argument('--limit', type=int, default=50)
+    tags_parser = commands.add_parser('tags', help="most common tags")
+    tags_parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args()
+
+    index = PostIndex(args.index)
+    try:
+        if args.command == 'index':
+            index.update(args.roots)
+            return
+        started = time.perf_counter()
+        if args.command == 'search':
+            results = index.search(args.text, args.tag, args.min_likes, args.min_collects, args.scope, args.author, args.limit)
+            lines = [f"{row['likes'] if row['likes'] is not None else '-':>7}  {row['title'] or '(untitled)'}  {row['path']}"
+                     for row in results]
+        elif args.command == 'users':
+            results = index.users(args.text, args.min_fans, args.limit)
+            lines = [f"{row['fans'] if row['fans'] is not None else '-':>9}  {row['user_name']}  {row['path']}" for row in results]
+        else:
+            results = index.top_tags(args.limit)
+            lines = [f"{count:6d}  {tag}" for tag, count in results]
+        print(f"{len(results)} results in {1000 * (time.perf_counter() - started):.1f}ms")
+        for line in lines:
+            print(line)
+    finally:
+        index.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet compaction is optional; the JSONL streams are always written
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DIR = 'records'
+
+def parse_count(text):
+    # XHS counts as shown on the page: "1234", "1,234", "1.2万", "3千", "10+"; None when there is no number
+    if text is None:
+        return None
+    if isinstance(text, int):
+        return text
+    match = re.search(r'(\d+(?:\.\d+)?)\s*([万千wWkK]?)', str(text).replace(',', ''))
+    if not match:
+        return None
+    value = float(match.group(1))
+    multiplier = {'万': 10000, 'w': 10000, 'W': 10000, '千': 1000, 'k': 1000, 'K': 1000}.get(match.group(2), 1)
+    return int(round(value * multiplier))
+
+def text_or_none(value):
+    value = (value or '').strip() if isinstance(value, str) else value
+    return None if value in ('', 'Not available', 'N/A') else value
+
+def post_record(scope, post_id, post_url, post_info, media):
+    return {
+        'note_id': post_id,
+        'url': post_url,
+        'scope': os.path.basename(scope),
+        'title': text_or_none(post_info.get('title')),
+        'description': text_or_none(post_info.get('description')),
+        'date': text_or_none(post_info.get('date')),
+        'author': text_or_none(post_info.get('author')),
+        'likes': parse_count(post_info.get('likes')),
+        'collects': parse_count(post_info.get('collects')),
+        'comments': parse_count(post_info.get('comments')),
+        'tags': [tag for tag in post_info.get('tags') or [] if tag],
+        'media': media,
+        'scraped_at': time.time(),
+    }
+
+def media_entry(kind, url, path, sha256=None, variant=None):
+    size = os.path.getsize(path) if os.path.exists(path) else None
+    return {'type': kind, 'url': url, 'path': path, 'sha256': sha256, 'size': size, 'variant': variant}
+
+def user_record(profile_url, info, total_posts):
+    def strip_label(value):
+        # "小红书号：123" / "IP属地：上海" carry their label in the value
+        value = text_or_none(value)
+        return value.split('：', 1)[-1] if value else value
+
+    return {
+        'url': profile_url,
+        'user_name': text_or_none(info.get('User Name')),
+        'account': strip_label(info.get('Account number')),
+        'ip_location': strip_label(info.get('IP Location')),
+        'description': text_or_none(info.get('User Description')),
+        'gender_and_tag': text_or_none(info.get('Gender and Tag')),
+        'following': parse_count(info.get('Following')),
+        'fans': parse_count(info.get('Fans')),
+        'likes_and_collects': parse_count(info.get('Likes and Collects')),
+        'total_posts': total_posts,
+        'scraped_at': time.time(),
+    }
+
+MEDIA_TYPE = None if pa is None else pa.list_(pa.struct([
+    ('type', pa.string()), ('url', pa.string()), ('path', pa.string()),
+    ('sha256', pa.string()), ('size', pa.int64()), ('variant', pa.string()),
+]))
+
+SCHEMAS = {} if pa is None else {
+    'posts': pa.schema([
+        ('note_id', pa.string()), ('url', pa.string()), ('scope', pa.string()), ('title', pa.string()),
+        ('description', pa.string()), ('date', pa.string()), ('author', pa.string()),
+        ('likes', pa.int64()), ('collects', pa.int64()), ('comments', pa.int64()),
+        ('tags', pa.list_(pa.string())), ('media', MEDIA_TYPE), ('scraped_at', pa.float64()),
+    ]),
+    'users': pa.schema([
+        ('url', pa.string()), ('user_name', pa.string()), ('account', pa.string()), ('ip_location', pa.string()),
+        ('description', pa.string()), ('gender_and_tag', pa.string()), ('following', pa.int64()),
+        ('fans', pa.int64()), ('likes_and_collects', pa.int64()), ('total_posts', pa.int64()), ('scraped_at', pa.float64()),
+    ]),
+}
+
+# Records that describe the same thing across runs; compaction keeps the latest
+RECORD_KEYS = {'posts': 'note_id', 'users': 'url'}
+
+class RecordWriter:
+    # Appends typed records to <folder>/records/<kind>-<run id>.jsonl, one stream per run.
+    # Appends go through the crawl's AsyncWriter pool; the lock keeps lines whole.
+    def __init__(self, writer):
+        self.writer = writer
+        self.run_id = time.strftime('%Y%m%d-%H%M%S')
+        self.lock = threading.Lock()
+        self.folders = set()
+        self.count = 0
+
+    def stream_path(self, folder, kind):
+        return os.path.join(folder, RECORDS_DIR, f"{kind}-{self.run_id}.jsonl")
+
+    def append_line(self, path, line):
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    async def append(self, folder, kind, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        await self.writer.run(self.append_line, self.stream_path(folder, kind), line)
+        self.folders.add(folder)
+        self.count += 1
+
+    async def compact(self):
+        # Rebuilds the Parquet files of every folder this run wrote to
+        for folder in sorted(self.folders):
+            for kind in SCHEMAS:
+                await self.writer.run(compact_folder, folder, kind)
+
+    def summary(self):
+        return f"Records: {self.count} appended to {len(self.folders)} folder(s), run {self.run_id}"
+
+def read_records(folder, kind):
+    records = []
+    for path in sorted(glob.glob(os.path.join(folder, RECORDS_DIR, f"{kind}-*.jsonl"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line in a stream
+                    logger.warning(f"Skipping malformed record in {path}")
+    return records
+
+def compact_folder(folder, kind='posts'):
+    # Merges every run's JSONL stream into <folder>/records/<kind>.parquet, latest record per key
+    if pa is None:
+        logger.warning("pyarrow is not installed; keeping JSONL streams only")
+        return None
+    latest = {}
+    for record in read_records(folder, kind):
+        key = record.get(RECORD_KEYS[kind])
+        if key not in latest or record.get('scraped_at', 0) >= latest[key].get('scraped_at', 0):
+            latest[key] = record
+    if not latest:
+        return None
+    schema = SCHEMAS[kind]
+    rows = [{name: record.get(name) for name in schema.names} for record in latest.values()]
+    table = pa.Table.from_pylist(rows, schema=schema)
+    path = os.path.join(folder, RECORDS_DIR, f"{kind}.parquet")
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+    logger.info(f"Compacted {len(rows)} {kind} records into {path}")
+    return path
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compact per-run JSONL record streams into Parquet")
+    parser.add_argument('folders', nargs='+', help="keyword or user folders holding a records/ directory")
+    args = parser.parse_args()
+    for folder in args.folders:
+        for kind in SCHEMAS or RECORD_KEYS:
+            compact_folder(folder, kind)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Starting requests/second per host suffix; anything else starts at the limiter's default rate
+XHS_HOST_RATES = {
+    'xiaohongshu.com': 0.3,
+    'xhscdn.com': 8.0,
+    # Image processing host for CDN size/format variants
+    'ci.xiaohongshu.com': 8.0,
+}
+
+def host_of(url_or_host):
+    if '://' not in url_or_host:
+        return url_or_host
+    return urlparse(url_or_host).hostname or url_or_host
+
+class HostBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AdaptiveRateLimiter:
+    # Token bucket per host with AIMD-style pacing: the rate creeps up while responses are
+    # healthy and is cut multiplicatively (with a pause) on 429s, login redirects or captchas.
+    def __init__(self, default_rate=1.0, host_rates=None, min_rate=0.02, max_rate=None,
+                 increase=1.05, decrease=0.5, burst=1, throttle_pause=30, jitter=0.3):
+        self.default_rate = default_rate
+        self.host_rates = host_rates or {}
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.throttle_pause = throttle_pause
+        self.jitter = jitter
+        self.buckets = {}
+        self.throttles = 0
+
+    def initial_rate(self, host):
+        # The longest matching suffix wins, so a subdomain can be paced apart from its site
+        matches = [suffix for suffix in self.host_rates if host == suffix or host.endswith('.' + suffix)]
+        if not matches:
+            return self.default_rate
+        return self.host_rates[max(matches, key=len)]
+
+    def bucket(self, url_or_host):
+        host = host_of(url_or_host)
+        if host not in self.buckets:
+            self.buckets[host] = HostBucket(self.initial_rate(host), self.burst)
+        return self.buckets[host]
+
+    def ceiling(self, host):
+        return self.max_rate or self.initial_rate(host) * 4
+
+    async def acquire(self, url_or_host):
+        bucket = self.bucket(url_or_host)
+        await bucket.acquire()
+        if self.jitter:
+            await asyncio.sleep(random.uniform(0, self.jitter / bucket.rate))
+
+    def record_success(self, url_or_host):
+        host = host_of(url_or_host)
+        bucket = self.bucket(host)
+        bucket.rate = min(self.ceiling(host), bucket.rate * self.increase)
+
+    def record_throttle(self, url_or_host, reason=""):
+        host = host_of(url_or_host)
+        bucket = self.bucket(host)
+        bucket.refill()
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+        # Negative tokens hold the bucket closed for throttle_pause seconds
+        bucket.tokens = min(bucket.tokens, 0) - bucket.rate * self.throttle_pause
+        self.throttles += 1
+        logger.warning(f"Throttled by {host}{f' ({reason})' if reason else ''}, rate now {bucket.rate:.3f} req/s")
+
+    def record_status(self, url_or_host, status):
+        if status == 429 or status == 503:
+            self.record_throttle(url_or_host, f"HTTP {status}")
+        elif 200 <= status < 400:
+            self.record_success(url_or_host)
+
+    def rate(self, url_or_host):
+        return self.bucket(url_or_host).rate
+
+    def rates(self):
+        return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+    def summary(self):
+        rates = ", ".join(f"{host}: {rate:.2f}/s" for host, rate in sorted(self.rates().items())) or "no requests"
+        return f"Rate limiter: {rates}; {self.throttles} throttle event(s)"
@@ -0,0 +1,81 @@
+import base64
+import logging
+from collections import Counter
+from playwright.async_api import Error as PlaywrightError
+
+logger = logging.getLogger(__name__)
+
+# Resource types the scrapers never need rendered: we only read their URLs and fetch them ourselves
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+
+# URL fragments of analytics, tracking and telemetry requests
+TRACKER_PATTERNS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'facebook.net',
+    'hotjar.com',
+    'sentry.io',
+    'apm-fe.xiaohongshu.com',
+    't2.xiaohongshu.com',
+    'fe-video-qc.xhscdn.com',
+)
+
+# Blocked requests transfer nothing, so their size is estimated per resource type
+ESTIMATED_BYTES = {
+    'image': 120_000,
+    'media': 1_500_000,
+    'font': 40_000,
+    'tracker': 5_000,
+}
+
+# 1x1 transparent GIF served in place of blocked images so pages don't take their error paths
+STUB_IMAGE = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+class ResourcePolicy:
+    def __init__(self, blocked_types=BLOCKED_RESOURCE_TYPES, tracker_patterns=TRACKER_PATTERNS, stub_images=True):
+        self.blocked_types = set(blocked_types)
+        self.tracker_patterns = tuple(tracker_patterns)
+        self.stub_images = stub_images
+        self.blocked = Counter()
+        self.allowed = 0
+
+    async def install(self, context):
+        await context.route('**/*', self.handle_route)
+
+    def classify(self, request):
+        if any(pattern in request.url for pattern in self.tracker_patterns):
+            return 'tracker'
+        if request.resource_type in self.blocked_types:
+            return request.resource_type
+        return None
+
+    async def handle_route(self, route):
+        request = route.request
+        category = self.classify(request)
+        try:
+            if category is None:
+                self.allowed += 1
+                await route.continue_()
+                return
+            self.blocked[category] += 1
+            if category == 'image' and self.stub_images:
+                await route.fulfill(status=200, content_type='image/gif', body=STUB_IMAGE)
+            else:
+                await route.abort('blockedbyclient')
+        except PlaywrightError as e:
+            # The page may have navigated away or closed while the request was in flight
+            logger.debug(f"Route handling failed for {request.url}: {e}")
+
+    @property
+    def saved_requests(self):
+        return sum(self.blocked.values())
+
+    @property
+    def saved_bytes(self):
+        return sum(ESTIMATED_BYTES.get(category, 0) * count for category, count in self.blocked.items())
+
+    def summary(self):
+        by_type = ", ".join(f"{category}: {count}" for category, count in self.blocked.most_common()) or "none"
+        return (f"Blocked {self.saved_requests} of {self.saved_requests + self.allowed} browser requests "
+                f"({by_type}), ~{self.saved_bytes / 1_000_000:.1f} MB saved (estimated)")
@@ -0,0 +1,160 @@
+import re
+from urllib.parse import urljoin
+
+# Width our design boards need; the smallest candidate at least this wide is picked
+TARGET_WIDTH = 1600
+
+# Used to evaluate `sizes` media conditions and vw lengths
+VIEWPORT_WIDTH = 1920
+FONT_SIZE_PX = 16
+
+DESCRIPTOR_RE = re.compile(r'^(\d+(?:\.\d+)?)([wx])$', re.IGNORECASE)
+MEDIA_FEATURE_RE = re.compile(r'\(\s*(min|max)-width\s*:\s*(\d+(?:\.\d+)?)(px|em|rem)\s*\)', re.IGNORECASE)
+LENGTH_RE = re.compile(r'^(\d+(?:\.\d+)?)(px|vw|em|rem)$', re.IGNORECASE)
+
+class Candidate:
+    def __init__(self, url, width=None, density=None):
+        self.url = url
+        self.width = width
+        self.density = density
+
+    def __repr__(self):
+        return f"Candidate({self.url!r}, width={self.width}, density={self.density})"
+
+def parse_srcset(srcset):
+    # Follows the HTML srcset parsing steps: a URL is a run of non-whitespace (so it may contain
+    # commas), and its descriptors run to the next comma outside parentheses
+    candidates = []
+    pos, length = 0, len(srcset or '')
+    while pos < length:
+        while pos < length and (srcset[pos].isspace() or srcset[pos] == ','):
+            pos += 1
+        if pos >= length:
+            break
+        start = pos
+        while pos < length and not srcset[pos].isspace():
+            pos += 1
+        url = srcset[start:pos]
+        descriptors = []
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start, depth = pos, 0
+            while pos < length:
+                char = srcset[pos]
+                if char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth = max(0, depth - 1)
+                elif char == ',' and depth == 0:
+                    break
+                pos += 1
+            descriptors = srcset[start:pos].split()
+        candidate = candidate_from_descriptors(url, descriptors)
+        if candidate is not None:
+            candidates.append(candidate)
+    return candidates
+
+def candidate_from_descriptors(url, descriptors):
+    if not url:
+        return None
+    width = density = None
+    for descriptor in descriptors:
+        match = DESCRIPTOR_RE.match(descriptor)
+        if not match:
+            # Height descriptors and anything unknown are ignored; a malformed w/x drops the candidate
+            if descriptor[-1:].lower() in ('w', 'x'):
+                return None
+            continue
+        value, kind = float(match.group(1)), match.group(2).lower()
+        if kind == 'w':
+            width = int(value)
+        else:
+            density = value
+    if width is None and density is None:
+        density = 1.0
+    return Candidate(url, width=width, density=density)
+
+def css_length_px(value, viewport_width=VIEWPORT_WIDTH):
+    match = LENGTH_RE.match(value.strip())
+    if not match:
+        return None
+    number, unit = float(match.group(1)), match.group(2).lower()
+    if unit == 'vw':
+        return number * viewport_width / 100
+    if unit in ('em', 'rem'):
+        return number * FONT_SIZE_PX
+    return number
+
+def media_matches(condition, viewport_width=VIEWPORT_WIDTH):
+    # Only (min-width)/(max-width) conditions joined by "and" are understood; anything else doesn't match
+    features = MEDIA_FEATURE_RE.findall(condition)
+    remainder = MEDIA_FEATURE_RE.sub('', condition).replace('and', '').strip()
+    if not features or remainder:
+        return False
+    for bound, value, unit in features:
+        px = float(value) * (FONT_SIZE_PX if unit.lower() != 'px' else 1)
+        if (bound.lower() == 'min' and viewport_width < px) or (bound.lower() == 'max' and viewport_width > px):
+            return False
+    return True
+
+def slot_width(sizes, viewport_width=VIEWPORT_WIDTH):
+    # Rendered width in CSS px chosen by a `sizes` attribute, or None when it can't be evaluated
+    for entry in (sizes or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        condition, _, length = entry.rpartition(' ')
+        if condition and not media_matches(condition, viewport_width):
+            continue
+        return css_length_px(length, viewport_width)
+    return None
+
+def choose_candidate(candidates, target_width=TARGET_WIDTH, base_width=None):
+    # Density candidates are sized against base_width (the width attribute or sizes slot) when known.
+    # Among sized candidates the smallest meeting target_width wins, else the largest available;
+    # without any widths the highest density is the best guess.
+    if not candidates:
+        return None
+    sized = []
+    for candidate in candidates:
+        width = candidate.width
+        if width is None and base_width:
+            width = candidate.density * base_width
+        if width is not None:
+            sized.append((width, candidate))
+    if sized:
+        if target_width is not None:
+            meeting = [item for item in sized if item[0] >= target_width]
+            if meeting:
+                return min(meeting, key=lambda item: item[0])[1]
+        return max(sized, key=lambda item: item[0])[1]
+    return max(candidates, key=lambda candidate: candidate.density or 1.0)
+
+def resolve_image(srcsets=(), src=None, width=None, sizes=None, base_url=None, target_width=TARGET_WIDTH):
+    # srcsets: <picture><source> srcsets followed by the <img> srcset. src is the plain fallback.
+    candidates = []
+    for srcset in srcsets:
+        candidates.extend(parse_srcset(srcset))
+    try:
+        base_width = int(width) if width else None
+    except ValueError:
+        base_width = None
+    if base_width is None:
+        base_width = slot_width(sizes)
+    if src:
+        candidates.append(Candidate(src, width=None, density=1.0))
+    candidates = [c for c in candidates if not c.url.lower().split('?')[0].endswith('.svg') and not c.url.startswith('data:')]
+    chosen = choose_candidate(candidates, target_width, base_width)
+    if chosen is None:
+        return None
+    return urljoin(base_url, chosen.url) if base_url else chosen.url
+
+def resolve_img_tag(img, base_url=None, target_width=TARGET_WIDTH):
+    # BeautifulSoup <img>, including the <source> siblings of an enclosing <picture>
+    srcsets = []
+    picture = img.find_parent('picture')
+    if picture is not None:
+        srcsets.extend(source.get('srcset') or source.get('data-srcset') or '' for source in picture.find_all('source'))
+    srcsets.append(img.get('srcset') or img.get('data-srcset') or '')
+    return resolve_image(srcsets, img.get('src') or img.get('data-src'), img.get('width'), img.get('sizes'), base_url, target_width)
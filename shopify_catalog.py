@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from urllib.parse import urlparse
+import aiohttp
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Sites in WEBSITES that are Shopify storefronts, mapped to their store root
+SHOPIFY_STORES = {
+    "alamour": "https://www.alamourthelabel.com/en-us",
+}
+
+# Shopify caps products.json at 250 products per page
+PRODUCTS_PAGE_LIMIT = 250
+MAX_PAGES = 40
+CATALOG_TIMEOUT = 30
+
+def products_endpoint(store_url, collection=None):
+    if collection:
+        return f"{store_url}/collections/{collection}/products.json"
+    return f"{store_url}/products.json"
+
+def absolute_image_url(src):
+    # products.json serves protocol-relative URLs on older themes; the src itself is the original upload
+    return 'https:' + src if src.startswith('//') else src
+
+def matches_keyword(product, keyword):
+    return not keyword or keyword.lower() in product.get('title', '').lower()
+
+def product_images(product, store_url):
+    # One record per image at full resolution, with the variants that use it
+    variants = product.get('variants') or []
+    variant_titles = {variant['id']: variant.get('title') for variant in variants}
+    prices = [float(variant['price']) for variant in variants if variant.get('price')]
+    host = urlparse(store_url)
+    records = []
+    for image in sorted(product.get('images') or [], key=lambda image: image.get('position', 0)):
+        if not image.get('src'):
+            continue
+        records.append({
+            'url': absolute_image_url(image['src']),
+            'title': product.get('title', '').strip(),
+            'handle': product.get('handle'),
+            'product_id': product.get('id'),
+            'product_url': f"{host.scheme}://{host.netloc}{host.path}/products/{product.get('handle')}",
+            'position': image.get('position'),
+            'width': image.get('width'),
+            'height': image.get('height'),
+            'alt': image.get('alt'),
+            'variants': [variant_titles[v] for v in image.get('variant_ids') or [] if v in variant_titles],
+            'price_min': min(prices) if prices else None,
+            'price_max': max(prices) if prices else None,
+            'vendor': product.get('vendor'),
+            'product_type': product.get('product_type'),
+        })
+    return records
+
+def images_from_products(products, store_url, keyword=None):
+    images = []
+    for product in products:
+        if matches_keyword(product, keyword):
+            images.extend(product_images(product, store_url))
+    return images
+
+async def fetch_products(session, store_url, limiter=None, collection=None):
+    endpoint = products_endpoint(store_url, collection)
+    products = []
+    for page in range(1, MAX_PAGES + 1):
+        if limiter is not None:
+            await limiter.acquire(endpoint)
+        async with session.get(endpoint, params={'limit': PRODUCTS_PAGE_LIMIT, 'page': page},
+                               timeout=aiohttp.ClientTimeout(total=CATALOG_TIMEOUT)) as response:
+            if limiter is not None:
+                limiter.record_status(endpoint, response.status)
+            response.raise_for_status()
+            batch = (await response.json(content_type=None)).get('products') or []
+        products.extend(batch)
+        logger.info(f"Catalog page {page}: {len(batch)} products")
+        if len(batch) < PRODUCTS_PAGE_LIMIT:
+            break
+    return products
+
+async def fetch_catalog_images(session, site, keyword=None, limiter=None, collection=None):
+    # Every product image in the store (or one collection) whose title contains the keyword
+    store_url = SHOPIFY_STORES[site]
+    try:
+        products = await fetch_products(session, store_url, limiter, collection)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"Shopify catalog fetch from {store_url} failed: {e}")
+        return []
+    images = images_from_products(products, store_url, keyword)
+    print(f"Shopify catalog: {len(products)} products, {len(images)} matching images")
+    return images
+
+def fetch_products_sync(session, store_url, collection=None):
+    # requests.Session counterpart of fetch_products for the Selenium scripts
+    endpoint = products_endpoint(store_url, collection)
+    products = []
+    for page in range(1, MAX_PAGES + 1):
+        response = session.get(endpoint, params={'limit': PRODUCTS_PAGE_LIMIT, 'page': page}, timeout=CATALOG_TIMEOUT)
+        response.raise_for_status()
+        batch = response.json().get('products') or []
+        products.extend(batch)
+        if len(batch) < PRODUCTS_PAGE_LIMIT:
+            break
+    return products
+
+def fetch_catalog_images_sync(session, site, keyword=None, collection=None):
+    store_url = SHOPIFY_STORES[site]
+    try:
+        products = fetch_products_sync(session, store_url, collection)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Shopify catalog fetch from {store_url} failed: {e}")
+        return []
+    images = images_from_products(products, store_url, keyword)
+    print(f"Shopify catalog: {len(products)} products, {len(images)} matching images")
+    return images
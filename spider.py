@@ -1,7 +1,6 @@
 import os
 import time
 import requests
-from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -10,6 +9,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
+from image_discovery import ImageDiscovery
 
 def download_image(url, folder_path, count):
     try:
@@ -113,6 +113,7 @@ def scrape_images(url, keyword, num_images=20):
         print(f"Current page title: {driver.title}")
         print(f"Current URL: {driver.current_url}")
 
+        discovery = ImageDiscovery(driver)
         last_height = driver.execute_script("return document.body.scrollHeight")
         scroll_attempts = 0
         while count < num_images and scroll_attempts < 5:
@@ -126,13 +127,11 @@ def scrape_images(url, keyword, num_images=20):
             last_height = new_height
 
             print("Extracting image URLs")
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            img_tags = soup.find_all('img')
-            img_urls = [img.get('src') for img in img_tags if img.get('src') and img.get('src').startswith('http')]
+            # Only images added since the last pass are read back, and URLs already tried are skipped
+            records = discovery.new_images()
+            img_urls = discovery.unseen([record['src'] for record in records if record['src'] and record['src'].startswith('http')])
 
-            print(f"Found {len(img_urls)} image URLs")
+            print(f"Found {len(img_urls)} new image URLs")
 
             for img_url in img_urls:
                 if count >= num_images:
@@ -1,11 +1,18 @@
 import os
 import asyncio
-import requests
+import json
+import aiohttp
 from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
-from urllib.parse import urljoin
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from resource_policy import ResourcePolicy, BLOCKED_RESOURCE_TYPES
+from image_capture import ImageCapture
+from rate_limiter import AdaptiveRateLimiter
+from async_writer import AsyncWriter
+from fetch_mode import FetchModes, looks_js_gated
+from responsive_images import resolve_img_tag
+from shopify_catalog import SHOPIFY_STORES, fetch_catalog_images
+from urllib.parse import urljoin, urlparse
 import random
-import time
 
 # Dictionary of websites and their search URL formats
 WEBSITES = {
@@ -16,30 +23,91 @@ WEBSITES = {
     "ins_tag" : "https://www.picuki.com/tag/{}"
 }
 
-def download_image(session, url, folder_path, count, filename):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': url
-        }
-        response = session.get(url, headers=headers, stream=True, timeout=10)
-        if response.status_code == 200:
-            content_type = response.headers.get('content-type', '').lower()
-            if 'image' in content_type and content_type not in ['image/svg+xml', 'image/gif']:
-                file_path = os.path.join(folder_path, filename)
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(8192):
-                        f.write(chunk)
-                print(f"Downloaded: {url} as {filename}")
-                return count + 1
-            else:
-                print(f"Skipped: {url} (Not a valid image, or is SVG/GIF)")
-        else:
-            print(f"Failed to download: {url} - Status code: {response.status_code}")
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+]
+
+# "auto" tries a plain HTTP fetch of the search page and launches the browser only when that
+# finds no images or looks JS-gated; "http" and "browser" force one path
+FETCH_MODE = "auto"
+STATIC_FETCH_TIMEOUT = 20
+
+# Abort fonts/media/trackers and stub images in the browser; images are downloaded separately
+BLOCK_RESOURCES = True
+
+# Save images from the bodies the browser already loaded, downloading only what it missed.
+# Images are then left unblocked by the resource policy.
+CAPTURE_IMAGES = False
+
+# Image downloads: requests in flight, per-request timeout (seconds) and starting rate per image host
+DOWNLOAD_CONCURRENCY = 16
+DOWNLOAD_TIMEOUT = 10
+DOWNLOAD_RATE = 20.0
+PAGE_RATE = 0.5
+
+def is_wanted_image(content_type):
+    return 'image' in content_type and content_type not in ['image/svg+xml', 'image/gif']
+
+async def fetch_image(session, url, semaphore, limiter, capture=None):
+    captured = capture.pop(url) if capture is not None else None
+    if captured is not None:
+        body, content_type = captured
+        if is_wanted_image(content_type):
+            return body
+        print(f"Skipped: {url} (Not a valid image, or is SVG/GIF)")
+        return None
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': url
+    }
+    async with semaphore:
+        await limiter.acquire(url)
+        try:
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as response:
+                limiter.record_status(url, response.status)
+                if response.status != 200:
+                    print(f"Failed to download: {url} - Status code: {response.status}")
+                    return None
+                # Check the type before reading so skipped SVG/GIFs cost no body transfer
+                if not is_wanted_image(response.headers.get('content-type', '').lower()):
+                    print(f"Skipped: {url} (Not a valid image, or is SVG/GIF)")
+                    return None
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error downloading {url}: {e}")
+            return None
+
+async def download_images(session, candidates, folder_path, num_images, writer, limiter, capture=None):
+    # candidates: (url, filename builder) in page order. Each batch is fetched concurrently, but
+    # results are accepted in page order, so the saved set and filenames don't depend on timing.
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    count = 0
+    position = 0
+    while count < num_images and position < len(candidates):
+        batch = candidates[position:position + max(num_images - count, DOWNLOAD_CONCURRENCY)]
+        position += len(batch)
+        bodies = await asyncio.gather(*(fetch_image(session, url, semaphore, limiter, capture) for url, _ in batch))
+        writes = []
+        for (url, make_filename), body in zip(batch, bodies):
+            if body is None or count >= num_images:
+                continue
+            filename = make_filename(count)
+            writes.append(writer.write_bytes(os.path.join(folder_path, filename), body))
+            print(f"Downloaded: {url} as {filename}")
+            count += 1
+        await asyncio.gather(*writes)
     return count
 
+async def wait_for_new_content(page, previous_height, timeout=3000):
+    try:
+        await page.wait_for_function('h => document.body.scrollHeight > h', arg=previous_height, timeout=timeout)
+    except PlaywrightTimeoutError:
+        pass
+    return await page.evaluate("document.body.scrollHeight")
+
 def create_folder(keyword):
     folder_path = os.path.join(os.path.expanduser('~'), 'Desktop', f'{keyword}_images')
     if not os.path.exists(folder_path):
@@ -59,14 +127,10 @@ def extract_alamour_images(soup, keyword):
             for img_class in ['productitem--image-primary', 'productitem--image-alternate']:
                 img = container.find('img', class_=img_class)
                 if img:
-                    srcset = img.get('srcset', '')
-                    if srcset:
-                        # Get the highest resolution image from srcset
-                        sources = srcset.split(',')
-                        highest_res = sources[-1].strip().split(' ')[0]
-                        img_data.append((highest_res, product_name.text.strip()))
-                    elif img.get('src'):
-                        img_data.append((img['src'], product_name.text.strip()))
+                    # Smallest srcset candidate that still covers TARGET_WIDTH, or the plain src
+                    img_url = resolve_img_tag(img)
+                    if img_url:
+                        img_data.append((img_url, product_name.text.strip()))
     
     return img_data
 
@@ -80,30 +144,59 @@ def extract_ins_images(soup):
             img_data.append((src, alt))
     return img_data
 
-async def scrape_images(website, keyword, num_images=20):
-    folder_path = create_folder(keyword)
-    session = requests.Session()
-    count = 0
+def extract_image_data(website, soup, keyword, url):
+    img_data = []
+    if website == "alamour":
+        img_data = extract_alamour_images(soup, keyword)
+        img_urls = [urljoin(url, img_url) for img_url, _ in img_data]
+    elif website in ["ins_profile", "ins_tag"]:
+        img_data = extract_ins_images(soup)
+        img_urls = [img_url for img_url, _ in img_data]
+    else:
+        img_urls = []
+        for img in soup.find_all('img'):
+            img_url = resolve_img_tag(img, url)
+            if img_url:
+                img_urls.append(img_url)
 
-    user_agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    ]
+    # Remove duplicates while preserving order
+    return list(dict.fromkeys(img_urls)), img_data
 
+async def fetch_static_page(session, url, limiter):
+    # Plain GET of the search page; None when it can't be used without a browser
+    await limiter.acquire(url)
+    try:
+        async with session.get(url, headers={'User-Agent': random.choice(USER_AGENTS)},
+                               timeout=aiohttp.ClientTimeout(total=STATIC_FETCH_TIMEOUT)) as response:
+            limiter.record_status(url, response.status)
+            if response.status != 200 or 'html' not in response.headers.get('content-type', '').lower():
+                print(f"HTTP fetch of {url} unusable: status {response.status}")
+                return None
+            return await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"HTTP fetch of {url} failed: {e}")
+        return None
+
+async def render_page(url, limiter, capture=None):
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)  # Set to True for headless mode
-        context = await browser.new_context(user_agent=random.choice(user_agents))
+        context = await browser.new_context(user_agent=random.choice(USER_AGENTS))
+        policy = None
+        if BLOCK_RESOURCES:
+            blocked_types = [t for t in BLOCKED_RESOURCE_TYPES if not (CAPTURE_IMAGES and t == 'image')]
+            policy = ResourcePolicy(blocked_types=blocked_types)
+            await policy.install(context)
+        if capture is not None:
+            capture.attach(context)
         page = await context.new_page()
 
         try:
-            url = WEBSITES[website].format(keyword)
             print(f"Navigating to {url}")
             
-            await page.goto(url, timeout=60000, wait_until="networkidle")
-            
-            # Random delay
-            await page.wait_for_timeout(random.randint(3000, 6000))
+            await limiter.acquire(url)
+            response = await page.goto(url, timeout=60000, wait_until="networkidle")
+            if response is not None:
+                limiter.record_status(url, response.status)
             
             print("Page loaded successfully")
             print(f"Current page title: {await page.title()}")
@@ -113,60 +206,91 @@ async def scrape_images(website, keyword, num_images=20):
             last_height = await page.evaluate("document.body.scrollHeight")
             for _ in range(5):
                 await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await page.wait_for_timeout(random.randint(1000, 3000))
-                new_height = await page.evaluate("document.body.scrollHeight")
+                new_height = await wait_for_new_content(page, last_height)
                 if new_height == last_height:
                     break
                 last_height = new_height
 
-            print("Extracting image URLs")
-            page_content = await page.content()
-            soup = BeautifulSoup(page_content, 'html.parser')
-
-            if website == "alamour":
-                img_data = extract_alamour_images(soup, keyword)
-                img_urls = [urljoin(url, img_url) for img_url, _ in img_data]
-            elif website in ["ins_profile", "ins_tag"]:
-                img_data = extract_ins_images(soup)
-                img_urls = [img_url for img_url, _ in img_data]
-            else:
-                img_tags = soup.find_all('img')
-                img_urls = []
-                for img in img_tags:
-                    src = img.get('src') or img.get('data-src')
-                    if src and not src.lower().endswith('.svg'):
-                        img_urls.append(urljoin(url, src))
-            
-                srcset = img.get('srcset')
-                if srcset:
-                    sources = srcset.split(',')
-                    highest_res = sources[-1].strip().split(' ')[0]
-                    if not highest_res.lower().endswith('.svg'):
-                        img_urls.append(urljoin(url, highest_res))
+            return await page.content()
+        finally:
+            await browser.close()
+            if policy is not None:
+                print(policy.summary())
 
-            # Remove duplicates while preserving order
-            img_urls = list(dict.fromkeys(img_urls))
+async def scrape_images(website, keyword, num_images=20):
+    folder_path = create_folder(keyword)
+    count = 0
 
-            print(f"Found {len(img_urls)} unique image URLs")
+    url = WEBSITES[website].format(keyword)
+    limiter = AdaptiveRateLimiter(default_rate=DOWNLOAD_RATE, host_rates={urlparse(url).hostname: PAGE_RATE})
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY, ttl_dns_cache=300))
+    writer = AsyncWriter()
+    modes = FetchModes()
+    capture = None
 
-            for index, img_url in enumerate(img_urls):
-                if count >= num_images:
-                    break
-                if website in ["alamour", "ins"]:
-                    description = img_data[index][1]
-                    safe_description = "".join([c if c.isalnum() else "_" for c in description])[:50]  # Limit length and replace non-alphanumeric characters
-                    filename = f"{safe_description}_{index + 1}.jpg"
+    try:
+        # Server-rendered search pages don't need Chromium; try a plain GET first unless
+        # this site is known to need the browser
+        img_urls = []
+        page_content = None
+        catalog = []
+        if website in SHOPIFY_STORES and FETCH_MODE == "auto":
+            # Shopify stores expose their catalog as JSON: full-size images and product metadata, no rendering
+            catalog = await fetch_catalog_images(session, website, keyword, limiter)
+        if catalog:
+            await writer.write_text(os.path.join(folder_path, f"{website}_catalog.json"), json.dumps(catalog, ensure_ascii=False, indent=2))
+            img_data = [(image['url'], image['title']) for image in catalog]
+            img_urls = [image['url'] for image in catalog]
+            modes.record(website, "shopify")
+        else:
+            reason = "recorded as needing the browser"
+            if FETCH_MODE == "browser":
+                reason = "FETCH_MODE is browser"
+            elif FETCH_MODE == "http" or modes.try_http_first(website):
+                print(f"Fetching {url} over HTTP")
+                page_content = await fetch_static_page(session, url, limiter)
+                if page_content is None:
+                    reason = "HTTP fetch failed"
                 else:
-                    filename = f"image_{count + 1}.jpg"
-                count = download_image(session, img_url, folder_path, count, filename)
-            if count == 0:
-                print("No images were downloaded. The page source is:")
-                print(await page.content())
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-        finally:
-            await browser.close()
+                    img_urls, img_data = extract_image_data(website, BeautifulSoup(page_content, 'html.parser'), keyword, url)
+                    reason = "no images in server HTML"
+                    if looks_js_gated(page_content, len(img_urls)):
+                        img_urls, img_data = [], []
+                        reason = "page is a JS challenge"
+
+            if img_urls:
+                modes.record(website, "http")
+            elif FETCH_MODE != "http":
+                capture = ImageCapture() if CAPTURE_IMAGES else None
+                page_content = await render_page(url, limiter, capture)
+                print("Extracting image URLs")
+                img_urls, img_data = extract_image_data(website, BeautifulSoup(page_content, 'html.parser'), keyword, url)
+                modes.record(website, "browser", reason)
+
+        print(f"Found {len(img_urls)} unique image URLs")
+
+        candidates = []
+        for index, img_url in enumerate(img_urls):
+            if website in ["alamour", "ins"]:
+                description = img_data[index][1]
+                safe_description = "".join([c if c.isalnum() else "_" for c in description])[:50]  # Limit length and replace non-alphanumeric characters
+                filename = f"{safe_description}_{index + 1}.jpg"
+                candidates.append((img_url, lambda count, filename=filename: filename))
+            else:
+                candidates.append((img_url, lambda count: f"image_{count + 1}.jpg"))
+        count = await download_images(session, candidates, folder_path, num_images, writer, limiter, capture)
+        if count == 0 and page_content is not None:
+            print("No images were downloaded. The page source is:")
+            print(page_content)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        await writer.close()
+        await session.close()
+        if capture is not None:
+            print(capture.summary())
+        print(writer.summary())
 
     print(f"Download completed. Total images downloaded: {count}")
 
@@ -1,4 +1,5 @@
 import os
+import json
 import requests
 from bs4 import BeautifulSoup
 from selenium import webdriver
@@ -9,6 +10,10 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException
 from urllib.parse import urljoin
+from image_discovery import ImageDiscovery
+from fetch_mode import FetchModes, looks_js_gated
+from responsive_images import resolve_image, resolve_img_tag
+from shopify_catalog import SHOPIFY_STORES, fetch_catalog_images_sync
 
 # Dictionary of websites and their search URL formats
 WEBSITES = {
@@ -17,6 +22,13 @@ WEBSITES = {
     "pinterest": "https://www.pinterest.com/search/pins/?q={}&rs=typed",
 }
 
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# "auto" tries a plain HTTP fetch of the search page and launches Chrome only when that
+# finds no images or looks JS-gated; "http" and "browser" force one path
+FETCH_MODE = "auto"
+STATIC_FETCH_TIMEOUT = 20
+
 def download_image(session, url, folder_path, count, filename):
     try:
         headers = {
@@ -60,33 +72,53 @@ def extract_alamour_images(soup, keyword):
             for img_class in ['productitem--image-primary', 'productitem--image-alternate']:
                 img = container.find('img', class_=img_class)
                 if img:
-                    srcset = img.get('srcset', '')
-                    if srcset:
-                        # Get the highest resolution image from srcset
-                        sources = srcset.split(',')
-                        highest_res = sources[-1].strip().split(' ')[0]
-                        img_data.append((highest_res, product_name.text.strip()))
-                    elif img.get('src'):
-                        img_data.append((img['src'], product_name.text.strip()))
+                    # Smallest srcset candidate that still covers TARGET_WIDTH, or the plain src
+                    img_url = resolve_img_tag(img)
+                    if img_url:
+                        img_data.append((img_url, product_name.text.strip()))
     
     return img_data
 
+def image_urls_from_records(records, base_url):
+    img_urls = []
+    for record in records:
+        srcsets = record.get('sourceSrcsets', []) + [record['srcset'] or '']
+        img_url = resolve_image(srcsets, record['src'] or record['dataSrc'], record.get('width'), record.get('sizes'), base_url)
+        if img_url:
+            img_urls.append(img_url)
+    return img_urls
 
+def extract_image_data(website, soup, keyword, url):
+    if website == "alamour":
+        img_data = extract_alamour_images(soup, keyword)
+        return [urljoin(url, img_url) for img_url, _ in img_data], img_data
+    img_urls = []
+    for img in soup.find_all('img'):
+        img_url = resolve_img_tag(img, url)
+        if img_url:
+            img_urls.append(img_url)
+    return img_urls, []
 
-def scrape_images(website, keyword, num_images=20):
+def fetch_static_page(session, url):
+    # Plain GET of the search page; None when it can't be used without a browser
+    try:
+        response = session.get(url, headers={'User-Agent': USER_AGENT}, timeout=STATIC_FETCH_TIMEOUT)
+        if response.status_code == 200 and 'html' in response.headers.get('content-type', '').lower():
+            return response.text
+        print(f"HTTP fetch of {url} unusable: status {response.status_code}")
+    except requests.RequestException as e:
+        print(f"HTTP fetch of {url} failed: {e}")
+    return None
+
+def browse_images(website, keyword, url):
     service = Service(ChromeDriverManager().install())
     options = webdriver.ChromeOptions()
     options.add_argument('--headless')
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
     driver = webdriver.Chrome(service=service, options=options)
-    
-    count = 0
-    folder_path = create_folder(keyword)
-    session = requests.Session()
 
     try:
-        url = WEBSITES[website].format(keyword)
         print(f"Navigating to {url}")
         driver.get(url)
 
@@ -102,9 +134,17 @@ def scrape_images(website, keyword, num_images=20):
         print(f"Current page title: {driver.title}")
         print(f"Current URL: {driver.current_url}")
 
+        # Images are collected as each scroll pass adds them, so nodes recycled by virtualised
+        # grids are not lost and the full page is never re-parsed. Alamour needs the product
+        # containers for names and keyword matching, so it still parses the final page.
+        discovery = ImageDiscovery(driver)
+        img_urls = []
+
         # Scroll to load all content
         last_height = driver.execute_script("return document.body.scrollHeight")
         while True:
+            if website != "alamour":
+                img_urls.extend(discovery.unseen(image_urls_from_records(discovery.new_images(), url)))
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
             
             # Wait for page to load new content
@@ -121,26 +161,61 @@ def scrape_images(website, keyword, num_images=20):
             last_height = new_height
 
         print("Extracting image URLs")
-        page_source = driver.page_source
-        soup = BeautifulSoup(page_source, 'html.parser')
-        
+        img_data = []
         if website == "alamour":
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
             img_data = extract_alamour_images(soup, keyword)
             img_urls = [urljoin(url, img_url) for img_url, _ in img_data]
-        else: 
-            img_tags = soup.find_all('img')
-            img_urls = []
-            for img in img_tags:
-                src = img.get('src') or img.get('data-src')
-                if src and not src.lower().endswith('.svg'):
-                    img_urls.append(urljoin(url, src))
-                
-                srcset = img.get('srcset')
-                if srcset:
-                    sources = srcset.split(',')
-                    highest_res = sources[-1].strip().split(' ')[0]
-                    if not highest_res.lower().endswith('.svg'):
-                        img_urls.append(urljoin(url, highest_res))
+        else:
+            img_urls.extend(discovery.unseen(image_urls_from_records(discovery.new_images(), url)))
+        return img_urls, img_data, driver.page_source
+    finally:
+        driver.quit()
+
+def scrape_images(website, keyword, num_images=20):
+    count = 0
+    folder_path = create_folder(keyword)
+    session = requests.Session()
+    modes = FetchModes()
+
+    try:
+        url = WEBSITES[website].format(keyword)
+
+        # Server-rendered search pages don't need Chrome; try a plain GET first unless
+        # this site is known to need the browser
+        img_urls = []
+        page_source = None
+        catalog = []
+        if website in SHOPIFY_STORES and FETCH_MODE == "auto":
+            # Shopify stores expose their catalog as JSON: full-size images and product metadata, no rendering
+            catalog = fetch_catalog_images_sync(session, website, keyword)
+        if catalog:
+            with open(os.path.join(folder_path, f"{website}_catalog.json"), 'w', encoding='utf-8') as f:
+                json.dump(catalog, f, ensure_ascii=False, indent=2)
+            img_data = [(image['url'], image['title']) for image in catalog]
+            img_urls = [image['url'] for image in catalog]
+            modes.record(website, "shopify")
+        else:
+            reason = "recorded as needing the browser"
+            if FETCH_MODE == "browser":
+                reason = "FETCH_MODE is browser"
+            elif FETCH_MODE == "http" or modes.try_http_first(website):
+                print(f"Fetching {url} over HTTP")
+                page_source = fetch_static_page(session, url)
+                if page_source is None:
+                    reason = "HTTP fetch failed"
+                else:
+                    img_urls, img_data = extract_image_data(website, BeautifulSoup(page_source, 'html.parser'), keyword, url)
+                    reason = "no images in server HTML"
+                    if looks_js_gated(page_source, len(img_urls)):
+                        img_urls, img_data = [], []
+                        reason = "page is a JS challenge"
+
+            if img_urls:
+                modes.record(website, "http")
+            elif FETCH_MODE != "http":
+                img_urls, img_data, page_source = browse_images(website, keyword, url)
+                modes.record(website, "browser", reason)
 
         # Remove duplicates while preserving order
         img_urls = list(dict.fromkeys(img_urls))
@@ -157,14 +232,12 @@ def scrape_images(website, keyword, num_images=20):
                 filename = f"image_{count + 1}.jpg"
             count = download_image(session, img_url, folder_path, count, filename)
 
-        if count == 0:
+        if count == 0 and page_source is not None:
             print("No images were downloaded. The page source is:")
-            print(driver.page_source)
+            print(page_source)
 
     except Exception as e:
         print(f"An error occurred: {e}")
-    finally:
-        driver.quit()
 
     print(f"Download completed. Total images downloaded: {count}")
 
@@ -0,0 +1,36 @@
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, REPO)
+
+from post_index import PostIndex, parse_info_file, POST_KEYS
+
+ROOTS = [os.path.join(REPO, 'xhs_search'), os.path.join(REPO, 'xhs_profiles')]
+
+def count_files(name):
+    return sum(name in filenames for root in ROOTS for _, _, filenames in os.walk(root))
+
+def test_indexes_bundled_corpus(tmp_path):
+    index = PostIndex(str(tmp_path / 'index.db'))
+    try:
+        parsed, removed = index.update(ROOTS)
+        posts = index.conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+        users = index.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        assert posts == count_files('post_info.txt')
+        assert users == count_files('user_info.txt')
+        assert parsed == posts + users and removed == 0
+        # Second run only re-parses changed files
+        assert index.update(ROOTS) == (0, 0)
+        assert index.search(tags=['nba'])
+    finally:
+        index.close()
+
+def test_empty_values_and_continuation_lines(tmp_path):
+    path = tmp_path / 'post_info.txt'
+    path.write_text("Post URL: https://www.xiaohongshu.com/explore/669cad860000000025001f92\n\n"
+                    "title: t\ndescription: \nfirst line\nsecond line\nlikes: N/A\ntags:\n- #a\n", encoding='utf-8')
+    fields = parse_info_file(str(path), POST_KEYS)
+    assert fields['description'] == 'first line\nsecond line'
+    assert fields['likes'] == 'N/A'
+    assert fields['tags'] == ['#a']
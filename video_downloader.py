@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import os
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+VIDEO_CHUNK_SIZE = 256 * 1024
+# Files at least this large are split into parallel Range segments
+SEGMENT_THRESHOLD = 8 * 1024 * 1024
+MAX_SEGMENTS = 4
+SEGMENT_RETRIES = 4
+# Progress is flushed to the .part.json sidecar after this many new bytes
+PROGRESS_FLUSH_BYTES = 4 * 1024 * 1024
+
+class VideoDownloadError(Exception):
+    pass
+
+async def probe_video(session, url):
+    # Returns (total length or None, whether the server honours Range requests)
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            length = response.headers.get('Content-Length')
+            if response.status == 200 and length and length.isdigit() and int(length) > 0:
+                return int(length), response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    except aiohttp.ClientError as e:
+        logger.debug(f"HEAD failed for {url}: {e}")
+
+    async with session.get(url, headers={'Range': 'bytes=0-0'}) as response:
+        if response.status == 206:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            return (int(total) if total.isdigit() else None), True
+        if response.status == 200:
+            length = response.headers.get('Content-Length')
+            return (int(length) if length and length.isdigit() else None), False
+        raise VideoDownloadError(f"Status code: {response.status}")
+
+def plan_segments(total, max_segments=MAX_SEGMENTS):
+    count = 1 if total < SEGMENT_THRESHOLD else min(max_segments, -(-total // SEGMENT_THRESHOLD))
+    size = -(-total // count)
+    return [{'start': start, 'end': min(start + size, total) - 1, 'done': 0} for start in range(0, total, size)]
+
+async def run_io(writer, func, *args):
+    # Blocking file operations go through the crawl's AsyncWriter thread pool when one is given
+    if writer is None:
+        return func(*args)
+    return await writer.run(func, *args)
+
+def write_state(state_path, payload):
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, state_path)
+
+def finalize_part(part_path, save_path, state_path, total):
+    with open(part_path, 'r+b') as f:
+        f.flush()
+        os.fsync(f.fileno())
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise VideoDownloadError(f"Length mismatch for {save_path}: got {size}, expected {total}")
+    os.replace(part_path, save_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return size
+
+class DownloadState:
+    def __init__(self, state_path, url, total, segments):
+        self.state_path = state_path
+        self.url = url
+        self.total = total
+        self.segments = segments
+        self.unsaved = 0
+
+    @classmethod
+    def load_or_create(cls, state_path, part_path, url, total, max_segments):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('total') == total and os.path.exists(part_path) and os.path.getsize(part_path) == total:
+                logger.info(f"Resuming video download from {sum(s['done'] for s in saved['segments'])}/{total} bytes")
+                return cls(state_path, url, total, saved['segments'])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        with open(part_path, 'wb') as f:
+            f.truncate(total)
+        return cls(state_path, url, total, plan_segments(total, max_segments))
+
+    @property
+    def done(self):
+        return sum(segment['done'] for segment in self.segments)
+
+    def snapshot(self):
+        self.unsaved = 0
+        return {'url': self.url, 'total': self.total, 'segments': [dict(segment) for segment in self.segments]}
+
+    async def advance(self, segment, nbytes, writer=None):
+        segment['done'] += nbytes
+        self.unsaved += nbytes
+        if self.unsaved >= PROGRESS_FLUSH_BYTES:
+            await run_io(writer, write_state, self.state_path, self.snapshot())
+
+async def write_chunk(writer, fd, chunk, offset):
+    # A cancelled segment still waits for a pwrite already running on the pool, so the
+    # descriptor is never closed (and its number reused) under an in-flight write
+    write = asyncio.ensure_future(run_io(writer, os.pwrite, fd, chunk, offset))
+    try:
+        await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.wait([write])
+        raise
+
+async def fetch_segment(session, url, fd, state, segment, limiter=None, writer=None):
+    for attempt in range(SEGMENT_RETRIES):
+        offset = segment['start'] + segment['done']
+        if offset > segment['end']:
+            return
+        if limiter is not None:
+            await limiter.acquire(url)
+        try:
+            async with session.get(url, headers={'Range': f"bytes={offset}-{segment['end']}"}) as response:
+                if limiter is not None:
+                    limiter.record_status(url, response.status)
+                if response.status != 206:
+                    raise VideoDownloadError(f"Expected 206 for range request, got {response.status}")
+                async for chunk in response.content.iter_chunked(VIDEO_CHUNK_SIZE):
+                    chunk = chunk[:segment['end'] + 1 - offset]
+                    # pwrite carries its own offset, so segments can share the descriptor across threads
+                    await write_chunk(writer, fd, chunk, offset)
+                    offset += len(chunk)
+                    await state.advance(segment, len(chunk), writer)
+                    if offset > segment['end']:
+                        return
+        except (aiohttp.ClientError, asyncio.TimeoutError, VideoDownloadError) as e:
+            logger.warning(f"Segment {segment['start']}-{segment['end']} of {url} interrupted at {offset}: {e}")
+            await asyncio.sleep(2 ** attempt)
+    raise VideoDownloadError(f"Segment {segment['start']}-{segment['end']} failed after {SEGMENT_RETRIES} attempts")
+
+async def fetch_whole(session, url, part_path, limiter=None, writer=None):
+    # Servers without Range support: one streamed GET, restarted from scratch on failure
+    for attempt in range(SEGMENT_RETRIES):
+        if limiter is not None:
+            await limiter.acquire(url)
+        try:
+            async with session.get(url) as response:
+                if limiter is not None:
+                    limiter.record_status(url, response.status)
+                if response.status != 200:
+                    raise VideoDownloadError(f"Status code: {response.status}")
+                expected = response.content_length
+                written = 0
+                f = await run_io(writer, open, part_path, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(VIDEO_CHUNK_SIZE):
+                        await run_io(writer, f.write, chunk)
+                        written += len(chunk)
+                finally:
+                    await run_io(writer, f.close)
+                if expected is not None and written != expected:
+                    raise VideoDownloadError(f"Got {written} of {expected} bytes")
+                return written
+        except (aiohttp.ClientError, asyncio.TimeoutError, VideoDownloadError) as e:
+            logger.warning(f"Download of {url} interrupted: {e}")
+            await asyncio.sleep(2 ** attempt)
+    raise VideoDownloadError(f"Download failed after {SEGMENT_RETRIES} attempts")
+
+async def download_video_file(session, url, save_path, limiter=None, max_segments=MAX_SEGMENTS, writer=None):
+    part_path = save_path + '.part'
+    state_path = part_path + '.json'
+
+    total, accepts_ranges = await probe_video(session, url)
+    if total is not None and os.path.exists(save_path) and os.path.getsize(save_path) == total:
+        logger.info(f"Video already complete: {save_path}")
+        return total
+
+    if total is None or not accepts_ranges:
+        await fetch_whole(session, url, part_path, limiter, writer)
+    else:
+        state = await run_io(writer, DownloadState.load_or_create, state_path, part_path, url, total, max_segments)
+        fd = await run_io(writer, os.open, part_path, os.O_WRONLY)
+        tasks = [asyncio.ensure_future(fetch_segment(session, url, fd, state, segment, limiter, writer)) for segment in state.segments]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # When one segment fails the others are stopped before fd is closed and the state is saved
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await run_io(writer, os.close, fd)
+            await run_io(writer, write_state, state_path, state.snapshot())
+        if state.done != total:
+            raise VideoDownloadError(f"Length mismatch for {url}: got {state.done}, expected {total}")
+
+    return await run_io(writer, finalize_part, part_path, save_path, state_path, total)
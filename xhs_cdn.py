@@ -0,0 +1,106 @@
+import re
+from urllib.parse import urlparse
+
+# The original upload is served by key from the image host; resized/transcoded variants come
+# from the image processing host through imageView2 parameters
+XHS_ORIGINAL_HOST = 'https://sns-img-bd.xhscdn.com'
+XHS_PROCESS_HOST = 'https://ci.xiaohongshu.com'
+
+# Hosts that serve the same paths; hedged downloads go to another host of the same family
+XHS_MIRROR_HOSTS = (
+    ('sns-webpic-qc.xhscdn.com', 'sns-webpic-bd.xhscdn.com', 'sns-webpic.xhscdn.com'),
+    ('sns-img-qc.xhscdn.com', 'sns-img-bd.xhscdn.com', 'sns-img-hw.xhscdn.com'),
+)
+
+IMAGE_FORMATS = {'jpeg': 'jpg', 'jpg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/heic': 'heic',
+    'image/avif': 'avif',
+}
+
+# Signed webpic URLs start with a timestamp and a signature segment before the image key
+SIGNED_PREFIX_RE = re.compile(r'^\d{8,14}/[0-9a-f]{16,64}/', re.IGNORECASE)
+
+class ImageVariant:
+    # What to ask the CDN for. Specs: "as-is" (the URL from the page), "original",
+    # a max edge such as "1080", a format such as "webp", or both as "1080/webp".
+    def __init__(self, original=False, max_edge=None, format=None):
+        self.original = original
+        self.max_edge = max_edge
+        self.format = format
+
+    @classmethod
+    def parse(cls, spec):
+        spec = (spec or 'as-is').strip().lower()
+        if spec == 'as-is':
+            return cls()
+        if spec == 'original':
+            return cls(original=True)
+        max_edge = format = None
+        for part in spec.split('/'):
+            if part.isdigit():
+                max_edge = int(part)
+            elif part in IMAGE_FORMATS:
+                format = 'jpeg' if part == 'jpg' else part
+            else:
+                raise ValueError(f"Unknown image variant: {spec}")
+        return cls(max_edge=max_edge, format=format)
+
+    @property
+    def as_is(self):
+        return not self.original and self.max_edge is None and self.format is None
+
+    @property
+    def name(self):
+        if self.as_is:
+            return 'as-is'
+        if self.original:
+            return 'original'
+        return '/'.join(str(part) for part in (self.max_edge, self.format) if part is not None)
+
+    @property
+    def extension(self):
+        # Known up front only when a format is requested; otherwise taken from the response
+        return IMAGE_FORMATS[self.format] if self.format else None
+
+def image_key(url):
+    # The storage key shared by every variant of an XHS image, or None for non-XHS URLs
+    parsed = urlparse(url)
+    if not parsed.hostname or not (parsed.hostname.endswith('xhscdn.com') or parsed.hostname.endswith('xiaohongshu.com')):
+        return None
+    path = parsed.path.lstrip('/').split('!')[0]
+    path = SIGNED_PREFIX_RE.sub('', path)
+    return path or None
+
+def rewrite_image_url(url, variant):
+    # (url, variant name) to request; URLs the CDN layout isn't known for are left as they are
+    if variant.as_is:
+        return url, variant.name
+    key = image_key(url)
+    if key is None:
+        return url, 'as-is'
+    if variant.original:
+        return f"{XHS_ORIGINAL_HOST}/{key}", variant.name
+    params = 'imageView2/2'
+    if variant.max_edge is not None:
+        params += f"/w/{variant.max_edge}/h/{variant.max_edge}"
+    if variant.format is not None:
+        params += f"/format/{variant.format}"
+    return f"{XHS_PROCESS_HOST}/{key}?{params}", variant.name
+
+def extension_for(content_type, default='jpg'):
+    return CONTENT_TYPE_EXTENSIONS.get((content_type or '').split(';')[0].strip().lower(), default)
+
+def mirror_url(url):
+    # The same URL on the next host of its mirror family, or None when it has no known mirror
+    parsed = urlparse(url)
+    for family in XHS_MIRROR_HOSTS:
+        if parsed.hostname in family:
+            alternate = family[(family.index(parsed.hostname) + 1) % len(family)]
+            return parsed._replace(netloc=alternate).geturl()
+    return None
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import quote
+from playwright.async_api import Error as PlaywrightError
+
+logger = logging.getLogger(__name__)
+
+XHS_NOTE_URL = "https://www.xiaohongshu.com/explore/{}"
+
+SEARCH_FEED_ENDPOINT = "/api/sns/web/v1/search/notes"
+PROFILE_FEED_ENDPOINT = "/api/sns/web/v1/user_posted"
+
+def pick(data, *keys):
+    # Feed responses use snake_case, the embedded page state uses camelCase
+    for key in keys:
+        if data.get(key) is not None:
+            return data[key]
+    return None
+
+def parse_feed_item(item):
+    card = pick(item, 'note_card', 'noteCard') or item
+    note_id = pick(item, 'id', 'note_id', 'noteId') or pick(card, 'note_id', 'noteId')
+    model_type = item.get('model_type')
+    if not note_id or (model_type and model_type != 'note'):
+        return None
+    cover = card.get('cover') or {}
+    interact = pick(card, 'interact_info', 'interactInfo') or {}
+    user = card.get('user') or {}
+    return {
+        'note_id': note_id,
+        'xsec_token': pick(item, 'xsec_token', 'xsecToken') or pick(card, 'xsec_token', 'xsecToken'),
+        'title': pick(card, 'display_title', 'displayTitle', 'title') or "",
+        'type': card.get('type'),
+        'cover_url': pick(cover, 'url_default', 'urlDefault', 'url'),
+        'likes': pick(interact, 'liked_count', 'likedCount'),
+        'author': pick(user, 'nickname', 'nick_name', 'nickName'),
+    }
+
+def parse_feed_page(payload):
+    data = (payload or {}).get('data') or {}
+    raw_items = data.get('items') or data.get('notes') or []
+    items = [item for item in (parse_feed_item(raw) for raw in raw_items) if item]
+    return items, bool(data.get('has_more'))
+
+def post_url_from_item(item, xsec_source):
+    url = XHS_NOTE_URL.format(item['note_id'])
+    if item.get('xsec_token'):
+        url += f"?xsec_token={quote(item['xsec_token'])}&xsec_source={xsec_source}"
+    return url
+
+class FeedListener:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.pages = asyncio.Queue()
+        self.has_more = True
+        self.items = {}
+
+    def attach(self, page):
+        page.on('response', self.on_response)
+
+    def detach(self, page):
+        page.remove_listener('response', self.on_response)
+
+    async def on_response(self, response):
+        if self.endpoint not in response.url or response.status != 200:
+            return
+        try:
+            payload = await response.json()
+        except (PlaywrightError, ValueError) as e:
+            logger.warning(f"Could not decode feed response {response.url}: {e}")
+            return
+        items, has_more = parse_feed_page(payload)
+        logger.debug(f"Feed page with {len(items)} notes, has_more={has_more}")
+        self.has_more = has_more
+        await self.pages.put(items)
+
+    def seed_from_state(self, state):
+        # Profile pages render their first page of notes server-side into __INITIAL_STATE__
+        user = (state or {}).get('user') or {}
+        tabs = user.get('notes') or []
+        queries = user.get('noteQueries') or []
+        if not tabs or not tabs[0]:
+            return
+        items = [item for item in (parse_feed_item(raw) for raw in tabs[0]) if item]
+        if queries:
+            self.has_more = bool(queries[0].get('hasMore'))
+        self.pages.put_nowait(items)
+
+async def collect_feed_post_urls(page, listener, xsec_source, num_posts=None, queue=None, page_timeout=10, known=None):
+    post_urls = []
+    while True:
+        try:
+            items = await asyncio.wait_for(listener.pages.get(), timeout=page_timeout)
+        except asyncio.TimeoutError:
+            logger.info("No further feed pages received")
+            break
+
+        fresh = skipped = 0
+        for item in items:
+            if item['note_id'] in listener.items:
+                continue
+            listener.items[item['note_id']] = item
+            if known is not None and known(item['note_id']):
+                skipped += 1
+                continue
+            fresh += 1
+            post_url = post_url_from_item(item, xsec_source)
+            post_urls.append(post_url)
+            if queue is not None:
+                await queue.put(post_url)
+            if num_posts and len(post_urls) >= num_posts:
+                logger.info(f"Found required number of posts: {len(post_urls)}")
+                return post_urls
+
+        if not listener.has_more:
+            logger.info("Feed reports no more notes")
+            break
+        if skipped and not fresh:
+            logger.info("Reached notes that were already scraped")
+            break
+        # Scrolling to the bottom makes the page request the next feed page
+        await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
+
+    logger.info(f"Collected {len(post_urls)} post URLs from the feed API")
+    return post_urls
+
+async def save_listing(listener, folder, writer):
+    listing_path = os.path.join(folder, 'listing.json')
+    await writer.write_text(listing_path, json.dumps(list(listener.items.values()), ensure_ascii=False, indent=2))
+    logger.info(f"Listing metadata for {len(listener.items)} notes saved to {listing_path}")
@@ -3,20 +3,78 @@ import logging
 import json
 import os
 import re
-import random
 import aiohttp
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
-from tenacity import retry, stop_after_attempt, wait_exponential, wait_fixed
+from tenacity import retry, stop_after_attempt, wait_exponential
+from xhs_state import load_initial_state, note_id_from_url, note_from_state, post_info_from_note, image_urls_from_note, video_url_from_note
+from resource_policy import ResourcePolicy, BLOCKED_RESOURCE_TYPES
+from image_capture import ImageCapture
+from crawl import Crawl, extract_fields, save_image, download_video, record_media, discover_and_scrape_posts
+from crawl_ledger import CrawlLedger
+from async_writer import AsyncWriter
+from rate_limiter import AdaptiveRateLimiter, XHS_HOST_RATES
+from xhs_cdn import ImageVariant
+from blob_store import BlobStore
+from post_records import RecordWriter, post_record, media_entry
+from hedging import HedgePolicy
+from xhs_feed import FeedListener, SEARCH_FEED_ENDPOINT, collect_feed_post_urls, save_listing
 
 # Logger setup
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Download client pool settings, shared by every image/video download in a crawl
+DOWNLOAD_POOL_SIZE = 64
+DOWNLOAD_POOL_PER_HOST = 16
+DOWNLOAD_KEEPALIVE = 60
+DOWNLOAD_DNS_CACHE_TTL = 300
+
+# Post worker pool: number of concurrent pages. Pacing between requests comes from the crawl's rate limiter.
+POST_CONCURRENCY = 1
+
+# "state" reads window.__INITIAL_STATE__ (falling back to the DOM when it is missing), "dom" scrapes the rendered page
+EXTRACTION_MODE = "state"
+
+# "feed" decodes the paginated notes API responses (falling back to DOM scrolling), "dom" scrolls and reads post links
+LISTING_MODE = "feed"
+
+# Abort fonts/media/trackers and stub images in the browser; their URLs are still read from the page
+BLOCK_RESOURCES = True
+
+# Save post images from the bodies the browser already loaded, downloading only what it missed.
+# Images are then left unblocked by the resource policy. Only used when IMAGE_VARIANT is "as-is".
+CAPTURE_IMAGES = False
+
+# Record every post in the SQLite crawl ledger and skip posts already saved under the same folder
+USE_LEDGER = True
+
+# Image variant to request from the XHS CDN: "as-is" (the URL the page uses), "original",
+# a max edge such as "1080", a format such as "webp"/"jpeg", or both as "1080/webp".
+# Variants the CDN refuses fall back to the page's URL.
+IMAGE_VARIANT = "as-is"
+
+# Duplicate image requests that outlast the recent p95 latency against a mirror CDN host,
+# keeping whichever finishes first. Stats are logged at the end of the crawl.
+HEDGE_DOWNLOADS = False
+
+# Keep each unique image once in a content-addressed store shared by search and profile crawls;
+# post folders get hardlinks, and images already in the store (per the ledger) are not fetched again
+USE_BLOB_STORE = True
+BLOB_STORE_ROOT = '/Users/yz/Desktop/spider/blobs'
+
+# "text" writes post_info.txt per post, "records" appends typed records to a per-run JSONL stream
+# under <folder>/records/ (compacted into Parquet when pyarrow is installed), "both" does both
+OUTPUT_FORMAT = "both"
+
 XHS_SEARCH_URL = "https://www.xiaohongshu.com/search_result?keyword={}&source=web_search_result_notes"
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 async def wait_for_posts(page):
     logger.info("Waiting for post elements...")
+    try:
+        await page.wait_for_selector('a[href^="/explore/"]', timeout=10000)
+    except PlaywrightTimeoutError:
+        pass
     elements = await page.query_selector_all('a[href^="/explore/"]')
     if not elements:
         # Log the page content for debugging
@@ -43,8 +101,10 @@ def sanitize_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", filename)
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-async def load_page(page, url):
+async def load_page(page, url, limiter=None):
     logger.info(f"Attempting to load page: {url}")
+    if limiter is not None:
+        await limiter.acquire(url)
     try:
         await page.goto(url, timeout=90000, wait_until="domcontentloaded")
         await page.wait_for_selector('body', timeout=90000)
@@ -56,30 +116,61 @@ async def load_page(page, url):
         logger.error(f"Playwright error loading page {url}: {e}")
         raise
 
-async def extract_element_text(page, selector):
-    element = await page.query_selector(selector)
-    return await element.text_content() if element else "Not available"
-
-async def extract_post_urls(page, num_posts):
-    post_urls = set()
+def create_download_session():
+    connector = aiohttp.TCPConnector(
+        limit=DOWNLOAD_POOL_SIZE,
+        limit_per_host=DOWNLOAD_POOL_PER_HOST,
+        keepalive_timeout=DOWNLOAD_KEEPALIVE,
+        ttl_dns_cache=DOWNLOAD_DNS_CACHE_TTL,
+        use_dns_cache=True,
+        ssl=False,
+    )
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+async def wait_for_new_content(page, previous_height, timeout=2000):
+    try:
+        await page.wait_for_function('h => document.body.scrollHeight > h', arg=previous_height, timeout=timeout)
+    except PlaywrightTimeoutError:
+        pass
+    return await page.evaluate('document.body.scrollHeight')
+
+async def extract_post_urls(page, num_posts, queue=None, known=None):
+    post_urls = []
+    seen = set()
     scroll_attempts = 0
     max_scroll_attempts = 10
 
     while scroll_attempts < max_scroll_attempts:
         try:
-            elements = await page.query_selector_all('a[href^="/explore/"]')
-            logger.info(f"Found {len(elements)} post elements")
-            new_urls = {await element.get_attribute('href') for element in elements}
-            post_urls.update(new_urls)
+            hrefs = await page.eval_on_selector_all('a[href^="/explore/"]', 'els => els.map(e => e.getAttribute("href"))')
+            logger.info(f"Found {len(hrefs)} post elements")
+            fresh = skipped = 0
+            for href in hrefs:
+                if len(post_urls) >= num_posts:
+                    break
+                if not href or href in seen:
+                    continue
+                seen.add(href)
+                post_url = f"https://www.xiaohongshu.com{href}"
+                if known is not None and known(note_id_from_url(post_url)):
+                    skipped += 1
+                    continue
+                fresh += 1
+                post_urls.append(post_url)
+                if queue is not None:
+                    await queue.put(post_url)
 
             if len(post_urls) >= num_posts:
                 logger.info(f"Found required number of posts: {len(post_urls)}")
                 break
+            if skipped and not fresh:
+                logger.info("Reached posts that were already scraped")
+                break
 
             previous_height = await page.evaluate('document.body.scrollHeight')
             await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-            await page.wait_for_timeout(2000)
-            new_height = await page.evaluate('document.body.scrollHeight')
+            new_height = await wait_for_new_content(page, previous_height)
 
             if new_height == previous_height:
                 logger.info("Reached end of page or no new content loaded")
@@ -92,132 +183,131 @@ async def extract_post_urls(page, num_posts):
 
         scroll_attempts += 1
 
-    full_post_urls = [f"https://www.xiaohongshu.com{url}" for url in post_urls]
-    logger.info(f"Extracted {len(full_post_urls)} post URLs")
-    return full_post_urls
+    logger.info(f"Extracted {len(post_urls)} post URLs")
+    return post_urls
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-async def download_image(session, url, save_path):
-    try:
-        async with session.get(url, ssl=False) as response:
-            if response.status == 200:
-                content = await response.read()
-                if len(content) == 0:
-                    raise aiohttp.ClientPayloadError("Received empty response")
-                with open(save_path, 'wb') as f:
-                    f.write(content)
-                logger.info(f"Image downloaded: {save_path}")
-            else:
-                logger.error(f"Failed to download image: {url} - Status code: {response.status}")
-                raise aiohttp.ClientError(f"Status code: {response.status}")
-    except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError) as e:
-        logger.error(f"Error downloading image {url}: {e}")
-        raise
-
-async def download_video(session, url, save_path):
-    try:
-        async with session.get(url, ssl=False) as response:
-            if response.status == 200:
-                with open(save_path, 'wb') as f:
-                    f.write(await response.read())
-                logger.info(f"Video downloaded: {save_path}")
-            else:
-                logger.error(f"Failed to download video: {url}")
-    except aiohttp.ClientError as e:
-        logger.error(f"Error downloading video {url}: {e}")
-
 async def extract_post_info(page):
-    post_info = {}
     selectors = {
         'title': '#detail-title',
         'description': 'span[data-v-6b50f68a]',
         'date': 'span.date',
         'author': '#noteContainer > div.interaction-container > div.author-container > div > div.info > a.name > span'
     }
-    for key, selector in selectors.items():
-        post_info[key] = await extract_element_text(page, selector)
+    list_selectors = {
+        'interactions': '.left .count',
+        'tags': 'a.tag',
+    }
+    post_info, lists = await extract_fields(page, selectors, list_selectors)
 
-    interactions = await page.query_selector_all('.left .count')
+    interactions = lists['interactions']
     if len(interactions) >= 3:
-        post_info['likes'] = await extract_number(interactions[0])
-        post_info['collects'] = await extract_number(interactions[1])
-        post_info['comments'] = await extract_number(interactions[2])
+        post_info['likes'] = extract_number(interactions[0])
+        post_info['collects'] = extract_number(interactions[1])
+        post_info['comments'] = extract_number(interactions[2])
     else:
         post_info['likes'] = post_info['collects'] = post_info['comments'] = "N/A"
 
-    tags = await page.query_selector_all('a.tag')
-    post_info['tags'] = [await tag.text_content() for tag in tags]
+    post_info['tags'] = lists['tags']
 
     return post_info
 
-async def extract_number(element):
-    text = await element.text_content()
-    number = ''.join(filter(str.isdigit, text))
+def extract_number(text):
+    number = ''.join(filter(str.isdigit, text or ''))
     return number if number else "0"
 
-async def scrape_post(page, post_url, keyword_folder):
+async def discover_post_urls(page, listener, num_posts, queue=None, known=None):
+    if listener is not None:
+        post_urls = await collect_feed_post_urls(page, listener, 'pc_search', num_posts, queue, known=known)
+        if post_urls:
+            return post_urls
+        logger.warning("No posts captured from the feed API, falling back to DOM scrolling")
+    return await extract_post_urls(page, num_posts, queue, known)
+
+async def extract_image_urls(page):
+    previous_height = await page.evaluate("document.body.scrollHeight")
+    while True:
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        new_height = await wait_for_new_content(page, previous_height)
+        if new_height == previous_height:
+            break
+        previous_height = new_height
+
+    srcs = await page.eval_on_selector_all('img', 'els => els.map(e => e.getAttribute("src"))')
+    return list(dict.fromkeys(src for src in srcs if src and 'webpic' in src))
+
+async def scrape_post(page, post_url, keyword_folder, crawl):
     logger.info(f"Scraping post: {post_url}")
     try:
-        await load_page(page, post_url)
+        await load_page(page, post_url, crawl.limiter)
 
         if "login" in page.url or await page.query_selector('.captcha-container'):
+            if crawl.limiter is not None:
+                crawl.limiter.record_throttle(post_url, "login redirect or captcha")
             raise Exception("Anti-bot measure detected")
+        if crawl.limiter is not None:
+            crawl.limiter.record_success(post_url)
 
         await page.wait_for_selector('body', timeout=90000)
-        post_info = await extract_post_info(page)
 
-        post_id = post_url.split('/')[-1]
+        note = None
+        if EXTRACTION_MODE == "state":
+            note = note_from_state(await load_initial_state(page), note_id_from_url(post_url))
+            if note is None:
+                logger.warning(f"No embedded state for {post_url}, falling back to DOM extraction")
+        post_info = post_info_from_note(note) if note else await extract_post_info(page)
+
+        post_id = note_id_from_url(post_url)
         post_title = post_info.get('title', '').strip() or f'post_{post_id}'
         post_folder_name = sanitize_filename(f"{post_title}_{post_id}")
         post_folder = os.path.join(keyword_folder, post_folder_name)
-        os.makedirs(post_folder, exist_ok=True)
-
-        with open(os.path.join(post_folder, 'post_info.txt'), 'w', encoding='utf-8') as f:
-            f.write(f"Post URL: {post_url}\n\n")
-            for key, value in post_info.items():
-                if isinstance(value, list):
-                    f.write(f"{key}:\n")
-                    for item in value:
-                        f.write(f"- {item}\n")
-                else:
-                    f.write(f"{key}: {value}\n")
-
-        video_url = await page.evaluate('''() => {
-            let videoMeta = document.querySelector('meta[name="og:video"]');
-            return videoMeta ? videoMeta.content : null;
-        }''')
+        await crawl.writer.makedirs(post_folder)
+
+        lines = [f"Post URL: {post_url}\n\n"]
+        for key, value in post_info.items():
+            if isinstance(value, list):
+                lines.append(f"{key}:\n")
+                lines.extend(f"- {item}\n" for item in value)
+            else:
+                lines.append(f"{key}: {value}\n")
+        if OUTPUT_FORMAT in ("text", "both"):
+            await crawl.writer.write_text(os.path.join(post_folder, 'post_info.txt'), ''.join(lines))
+
+        if note:
+            video_url = video_url_from_note(note)
+        else:
+            video_url = await page.evaluate('''() => {
+                let videoMeta = document.querySelector('meta[name="og:video"]');
+                return videoMeta ? videoMeta.content : null;
+            }''')
 
+        media = []
         if video_url:
             logger.debug(f"Found video: {video_url}")
-            async with aiohttp.ClientSession() as session:
-                video_path = os.path.join(post_folder, "video.mp4")
-                await download_video(session, video_url, video_path)
+            video_path = os.path.join(post_folder, "video.mp4")
+            if not await download_video(crawl.session, video_url, video_path, crawl.limiter, crawl.writer):
+                return False
+            sha256 = None
+            if crawl.ledger is not None:
+                sha256 = await record_media(crawl, post_id, video_url, video_path)
+            media.append(media_entry('video', video_url, video_path, sha256))
             logger.info(f"Video saved for: {post_url}")
         else:
-            previous_height = await page.evaluate("document.body.scrollHeight")
-            while True:
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await page.wait_for_timeout(2000)
-                new_height = await page.evaluate("document.body.scrollHeight")
-                if new_height == previous_height:
-                    break
-                previous_height = new_height
-
-            img_urls = set()
-            image_elements = await page.query_selector_all('img')
-            for img in image_elements:
-                src = await img.get_attribute('src')
-                if src and 'webpic' in src:
-                    img_urls.add(src)
+            img_urls = image_urls_from_note(note) if note else await extract_image_urls(page)
+            logger.debug(f"Extracted image elements: {img_urls}")
 
-            logger.debug(f"Extracted image elements: {list(img_urls)}")
-
-            async with aiohttp.ClientSession() as session:
-                tasks = [download_image(session, url, os.path.join(post_folder, f"image_{i+1}.jpg")) for i, url in enumerate(img_urls)]
-                await asyncio.gather(*tasks)
+            img_stems = [os.path.join(post_folder, f"image_{i+1}") for i in range(len(img_urls))]
+            tasks = [save_image(crawl, url, stem) for url, stem in zip(img_urls, img_stems)]
+            saved = await asyncio.gather(*tasks)
+            for url, (path, variant, sha256) in zip(img_urls, saved):
+                if crawl.ledger is not None:
+                    sha256 = await record_media(crawl, post_id, url, path, variant, sha256)
+                media.append(media_entry('image', url, path, sha256, variant))
 
             logger.info(f"Post info and images saved for: {post_url}")
+
+        if crawl.records is not None:
+            await crawl.records.append(keyword_folder, 'posts', post_record(keyword_folder, post_id, post_url, post_info, media))
         return True
     except PlaywrightTimeoutError as e:
         logger.error(f"Timeout error scraping post {post_url}: {e}")
@@ -228,7 +318,7 @@ async def scrape_post(page, post_url, keyword_folder):
     return False
 
 
-async def scrape_xhs_search(keyword, num_posts):
+async def scrape_xhs_search(keyword, num_posts, concurrency=POST_CONCURRENCY):
     logger.info(f"Starting scrape for keyword: {keyword}")
     search_url = XHS_SEARCH_URL.format(keyword)
 
@@ -241,14 +331,33 @@ async def scrape_xhs_search(keyword, num_posts):
             await context.add_cookies([{"name": k, "value": v, "domain": ".xiaohongshu.com", "path": "/"} for k, v in cookies.items()])
         else:
             logger.error("No cookies loaded. Scraping may fail.")
-        
+
+        policy = None
+        if BLOCK_RESOURCES:
+            blocked_types = [t for t in BLOCKED_RESOURCE_TYPES if not (CAPTURE_IMAGES and t == 'image')]
+            policy = ResourcePolicy(blocked_types=blocked_types)
+            await policy.install(context)
+        capture = ImageCapture(url_filter=lambda url: 'webpic' in url) if CAPTURE_IMAGES else None
+        if capture is not None:
+            capture.attach(context)
+
         page = await context.new_page()
+        session = create_download_session()
+        ledger = CrawlLedger() if USE_LEDGER else None
+        limiter = AdaptiveRateLimiter(host_rates=XHS_HOST_RATES)
+        writer = AsyncWriter()
+        hedge = HedgePolicy() if HEDGE_DOWNLOADS else None
+        blobs = BlobStore(BLOB_STORE_ROOT) if USE_BLOB_STORE else None
+        records = RecordWriter(writer) if OUTPUT_FORMAT in ("records", "both") else None
+        crawl = Crawl(session, capture, ledger, limiter, writer, ImageVariant.parse(IMAGE_VARIANT), hedge, blobs, records)
+        listener = FeedListener(SEARCH_FEED_ENDPOINT) if LISTING_MODE == "feed" else None
+        if listener is not None:
+            listener.attach(page)
 
         try:
-            await load_page(page, search_url)
+            await load_page(page, search_url, limiter)
             
             await page.wait_for_load_state('networkidle', timeout=30000)
-            await page.wait_for_timeout(5000)  # Wait an additional 5 seconds
 
             # Check if we're still on a search results page
             if not page.url.startswith("https://www.xiaohongshu.com/search_result"):
@@ -260,31 +369,47 @@ async def scrape_xhs_search(keyword, num_posts):
             # Wait for post elements with retry mechanism
             elements = await wait_for_posts(page)
 
-            post_urls = await extract_post_urls(page, num_posts)
-
             # Create keyword folder
             keyword_folder = os.path.join('/Users/yz/Desktop/spider/xhs_search', sanitize_filename(keyword))
-            os.makedirs(keyword_folder, exist_ok=True)
+            await writer.makedirs(keyword_folder)
+            known = (lambda note_id: ledger.is_done(keyword_folder, note_id)) if ledger is not None else None
 
-            post_count = 0
-            for post_url in post_urls:
-                if post_count >= num_posts:
-                    break
-                if not await scrape_post(page, post_url, keyword_folder):
-                    logger.warning(f"Failed to scrape post {post_url}")
-                await asyncio.sleep(random.uniform(2, 5))
-                post_count += 1
+            await discover_and_scrape_posts(
+                lambda queue: discover_post_urls(page, listener, num_posts, queue, known),
+                context, keyword_folder, crawl, scrape_post, concurrency,
+            )
+            if listener is not None and listener.items:
+                await save_listing(listener, keyword_folder, writer)
 
         except Exception as e:
             logger.error(f"An unexpected error occurred: {e}")
         finally:
+            if records is not None:
+                await records.compact()
+            await writer.close()
+            await session.close()
+            if ledger is not None:
+                ledger.close()
             await browser.close()
             logger.info("Browser closed")
+            if policy is not None:
+                logger.info(policy.summary())
+            if capture is not None:
+                logger.info(capture.summary())
+            logger.info(limiter.summary())
+            logger.info(writer.summary())
+            if hedge is not None:
+                logger.info(hedge.summary())
+            if blobs is not None:
+                logger.info(blobs.summary())
+            if records is not None:
+                logger.info(records.summary())
 
 async def main():
     keyword = input("Enter the search keyword: ")
     num_posts = int(input("Enter the number of posts to download (default is 20): ") or 20)
-    await scrape_xhs_search(keyword, num_posts)
+    concurrency = int(input(f"Enter the number of concurrent pages (default is {POST_CONCURRENCY}): ") or POST_CONCURRENCY)
+    await scrape_xhs_search(keyword, num_posts, concurrency)
     print("Scraping completed. Check the Desktop for the output files.")
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+import json
+import logging
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+XHS_VIDEO_CDN = "https://sns-video-bd.xhscdn.com/{}"
+
+# Raw text of the inline <script> that assigns window.__INITIAL_STATE__; reading it
+# avoids serialising the live (reactive) store object out of the page.
+INITIAL_STATE_JS = """() => {
+    for (const script of document.querySelectorAll('script')) {
+        const text = script.textContent;
+        if (text && text.trimStart().startsWith('window.__INITIAL_STATE__')) {
+            return text;
+        }
+    }
+    return null;
+}"""
+
+# String literals are matched (and kept as they are) so an `undefined` inside text like
+# "sizes S,undefined,L" is never rewritten; only bare values become null
+UNDEFINED_RE = re.compile(r'"(?:[^"\\]|\\.)*"|(?<=[:\[,])\s*undefined\s*(?=[,}\]])', re.S)
+
+def parse_initial_state(script_text):
+    if not script_text:
+        return None
+    match = re.search(r'window\.__INITIAL_STATE__\s*=\s*(\{.*\})\s*;?\s*$', script_text, re.S)
+    if not match:
+        return None
+    # The blob is a JS object literal: JSON plus bare `undefined` values
+    blob = UNDEFINED_RE.sub(lambda m: m.group(0) if m.group(0).startswith('"') else 'null', match.group(1))
+    try:
+        return json.loads(blob)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Could not decode __INITIAL_STATE__: {e}")
+        return None
+
+async def load_initial_state(page):
+    return parse_initial_state(await page.evaluate(INITIAL_STATE_JS))
+
+def note_id_from_url(post_url):
+    return post_url.split('?')[0].rstrip('/').split('/')[-1]
+
+def note_from_state(state, note_id):
+    detail_map = ((state or {}).get('note') or {}).get('noteDetailMap') or {}
+    entry = detail_map.get(note_id)
+    if entry is None and len(detail_map) == 1:
+        entry = next(iter(detail_map.values()))
+    note = (entry or {}).get('note') or {}
+    return note if note.get('noteId') or note.get('imageList') or note.get('video') else None
+
+def format_note_date(timestamp_ms):
+    if not timestamp_ms:
+        return "Not available"
+    return datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d')
+
+def post_info_from_note(note):
+    interact = note.get('interactInfo') or {}
+    return {
+        'title': note.get('title') or "Not available",
+        'description': note.get('desc') or "",
+        'date': format_note_date(note.get('time')),
+        'author': (note.get('user') or {}).get('nickname') or "Not available",
+        'likes': str(interact.get('likedCount') or "0"),
+        'collects': str(interact.get('collectedCount') or "0"),
+        'comments': str(interact.get('commentCount') or "0"),
+        'tags': [tag.get('name') for tag in note.get('tagList') or [] if tag.get('name')],
+    }
+
+def image_url_from_entry(image):
+    if image.get('urlDefault'):
+        return image['urlDefault']
+    for info in image.get('infoList') or []:
+        if info.get('imageScene') in ('WB_DFT', 'CRD_WM_WEBP') and info.get('url'):
+            return info['url']
+    return image.get('url') or image.get('urlPre')
+
+def image_urls_from_note(note):
+    urls = []
+    for image in note.get('imageList') or []:
+        url = image_url_from_entry(image)
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+def video_url_from_note(note):
+    if note.get('type') != 'video':
+        return None
+    video = note.get('video') or {}
+    stream = (video.get('media') or {}).get('stream') or {}
+    for codec in ('h264', 'h265', 'av1'):
+        for variant in stream.get(codec) or []:
+            if variant.get('masterUrl'):
+                return variant['masterUrl']
+    origin_key = (video.get('consumer') or {}).get('originVideoKey')
+    return XHS_VIDEO_CDN.format(origin_key) if origin_key else None
+
+def user_info_from_state(state):
+    page_data = ((state or {}).get('user') or {}).get('userPageData') or {}
+    basic = page_data.get('basicInfo') or {}
+    if not basic.get('nickname'):
+        return None
+    tags = [tag.get('name') for tag in page_data.get('tags') or [] if tag.get('name')]
+    counts = {item.get('type'): item.get('count') for item in page_data.get('interactions') or []}
+    return {
+        "User Name": basic['nickname'],
+        "Account number": f"小红书号：{basic['redId']}" if basic.get('redId') else "Not available",
+        "IP Location": f"IP属地：{basic['ipLocation']}" if basic.get('ipLocation') else "Not available",
+        "User Description": basic.get('desc') or "Not available",
+        "Gender and Tag": tags[0] if tags else "Not available",
+        "Following": str(counts.get('follows') or "Not available"),
+        "Fans": str(counts.get('fans') or "Not available"),
+        "Likes and Collects": str(counts.get('interaction') or "Not available"),
+    }